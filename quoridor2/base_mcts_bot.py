@@ -1,10 +1,71 @@
 from player import Player
 from calcstate import Calcstate
+from transposition_table import TranspositionTable
+from batch_rollout import BatchRollout
+from symmetry import from_canonical
+from endgame import EndgameSolver
+from multiprocessing import Pool
 import math, random
 
+# rollout worker processes (rollouts_per_leaf with rollout_workers) each keep one bot for its rollout settings
+_rollout_bot = None
+
+
+def _start_rollout_worker(rollout_options):
+    global _rollout_bot
+    _rollout_bot = BaseMCTSbot(0, verbose = False, **rollout_options)
+
+
+def _rollout_worker(task):
+    '''
+    Runs a share of a leaf's rollouts in a worker process
+
+    Args:
+        task: (serialized position, random seed, id of the searching player, number of rollouts)
+
+    Returns:
+        (summed results for the searching player, number of rollouts cut off at the rollout cap, number of rollouts
+        ended by the endgame solver)
+    '''
+    data, task_seed, player_id, count = task
+    random.seed(task_seed)
+    state = Calcstate()
+    state.load_serialized(data)
+    _rollout_bot.player_id = player_id
+    stats = _rollout_bot.rollout_stats
+    capped, solved = stats["capped"], stats["solved"]
+    value = sum(_rollout_bot._rollout_to_terminal(state) for _ in range(count))
+    return value, stats["capped"] - capped, stats["solved"] - solved
+
+
+def find_subtree(node, state, target_hash, plies):
+    '''
+    Depth first search through the existing children of node for the position with hash target_hash,
+    at most plies moves below node. The moves are played on state (which must be at node's position) and undone again.
+
+    Returns:
+        the matching node, or None
+    '''
+    if state.get_hash() == target_hash:
+        return node
+    if plies == 0:
+        return None
+    for move, child in node.children.items():
+        record = state.make_move(move)
+        found = find_subtree(child, state, target_hash, plies - 1)
+        state.undo_move(record)
+        if found is not None:
+            return found
+    return None
+
+
 class BaseMCTSnode:
-    def __init__(self, calcstate, parent, move_from_parent):
-        self.state = calcstate
+    __slots__ = ("state", "over", "parent", "move_from_parent", "N", "W", "children", "untried")
+
+    def __init__(self, calcstate, parent, move_from_parent, keep_state = True):
+        #with keep_state False (make/unmake search) the node only holds edge statistics and the state is rebuilt by replaying moves
+        self.state = calcstate if keep_state else None
+        self.over = calcstate.over
         self.parent = parent
         self.move_from_parent = move_from_parent
         self.N = 0
@@ -20,29 +81,137 @@ class BaseMCTSnode:
     @property
     def fully_expanded(self):
         return len(self.untried) == 0
+
+
+class TranspositionNode:
+    '''
+    Node of the transposition (DAG) search. One per position hash, shared by every move order that reaches it,
+    so it has no parent and its children are stored as move -> position hash (looked up in the TranspositionTable).
+    With a symmetry (the one Calcstate.get_canonical returned for calcstate) the moves are kept in the canonical orientation.
+    '''
+    __slots__ = ("over", "N", "W", "children", "untried")
+
+    def __init__(self, calcstate, symmetry = None):
+        self.over = calcstate.over
+        self.N = 0
+        self.W = 0.0
+        self.children = {}
+        self.untried = calcstate.get_legal_moves()
+        if symmetry is not None:
+            self.untried = [symmetry.moves[move] for move in self.untried]
+
+    @property
+    def q(self):
+        return 0.0 if self.N == 0 else self.W / self.N
     
 
 class BaseMCTSbot(Player):
-    def __init__(self, expansions):
+    def __init__(self, expansions, make_unmake = False, use_transpositions = False, table_size = 1000000, reuse_tree = True,
+                 verbose = True, rollouts_per_leaf = 1, rollout_workers = 0, rollout_engine = "python", rollout_policy = "random",
+                 rollout_weights = None, rollout_cap = 256, opening_book = None, use_symmetry = False,
+                 endgame_oracle = "cached"):
+        '''
+        Args:
+            expansions: number of search iterations per move
+            make_unmake: walk a single state down the tree with make_move / undo_move instead of storing a cloned state in every node
+            use_transpositions: search a DAG keyed by Calcstate hash, transpositions share one node (implies make_unmake)
+            table_size: most positions kept by the transposition table, least recently used ones are evicted
+            reuse_tree: carry the searched subtree over to the next choose_move call when the new position is in it
+            verbose: print search progress
+            rollouts_per_leaf: playouts run from every expanded leaf, backed up together as one update of N and W
+            rollout_workers: share a leaf's playouts out over this many worker processes (0 runs them in this process)
+            rollout_engine: "python" plays rollouts on Calcstates, "batch" plays a leaf's rollouts_per_leaf random
+                            playouts together in the NumPy engine of batch_rollout.py
+            rollout_policy: move choice of the python rollouts, "random" or "guided" (see Calcstate.get_rollout_move),
+                            the batch engine always plays uniformly random moves
+            rollout_weights: dict of probabilities for the guided policy (favored_prob, favored_pawn, unfavored_pawn)
+            rollout_cap: most plies a rollout plays before Calcstate.get_static_eval scores it instead (None plays to the end)
+            opening_book: OpeningBook consulted before searching, a confident book move is played without a search
+            use_symmetry: key the transposition table by Calcstate.get_canonical, so mirror image positions share a node
+            endgame_oracle: exact results for two player positions without walls left (see endgame.py). Such roots get
+                            the solver's move without a search and such leaves its result instead of rollouts. Rollouts
+                            that run out of walls take its result too, "cached" only if their wall layout has been
+                            solved before (solving a layout costs about as much as ten rollouts), "always" solving
+                            it if not. None turns the solver off.
+        '''
         self.expansion_count = expansions
+        self.make_unmake = make_unmake
+        self.use_transpositions = use_transpositions
+        self.table = TranspositionTable(table_size) if use_transpositions else None
+        self.use_symmetry = use_symmetry
+        # symmetry taking the transposition root to its canonical orientation (None is the identity)
+        self.root_symmetry = None
+        self.transposition_hits = 0
+        self.reuse_tree = reuse_tree
+        self.root = None
+        self.root_state = None
+        self.last_move = None
+        self.verbose = verbose
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_workers = rollout_workers
+        self.rollout_pool = None
+        self.rollout_engine = rollout_engine
+        self.rollout_policy = rollout_policy
+        self.rollout_weights = rollout_weights or {}
+        # settings a rollout worker needs to play out positions like this bot does
+        self.rollout_options = {"rollout_policy": rollout_policy, "rollout_weights": rollout_weights, "rollout_cap": rollout_cap,
+                                "endgame_oracle": endgame_oracle}
+        self.rollout_cap = rollout_cap
+        # rollouts played, how many of them the cap cut off and how many the endgame solver ended, over the bot's lifetime
+        self.rollout_stats = {"rollouts": 0, "capped": 0, "solved": 0}
+        self.opening_book = opening_book
+        self.book_moves = 0
+        self.endgame_oracle = endgame_oracle
+        self.endgame = EndgameSolver() if endgame_oracle else None
+        self.endgame_moves = 0
         self.c_uct = 1.414
-        self.rollout_cap = 256
         self.player_id = None
 
+    def get_rollout_pool(self):
+        #created on first use and kept for the bot's lifetime
+        if self.rollout_pool is None:
+            self.rollout_pool = Pool(self.rollout_workers, initializer = _start_rollout_worker, initargs = (self.rollout_options,))
+        return self.rollout_pool
+
+    def close(self):
+        #stops the worker processes, if any
+        if self.rollout_pool is not None:
+            self.rollout_pool.terminate()
+            self.rollout_pool.join()
+            self.rollout_pool = None
+
     def choose_move(self, gamestate):
         calcstate = Calcstate()
         calcstate.import_gamestate(gamestate)
         self.player_id = calcstate.player_up
         self.max_depth = 0
 
-        root = BaseMCTSnode(calcstate, None, None)
+        book_move = self._book_move(calcstate)
+        if book_move is not None:
+            return book_move
+        endgame_move = self._endgame_move(calcstate)
+        if endgame_move is not None:
+            return endgame_move
+
+        if self.use_transpositions:
+            return self._choose_move_transpositions(calcstate)
+
+        root = self._reuse_root(calcstate)
+        if root is None:
+            root = BaseMCTSnode(calcstate, None, None, not self.make_unmake)
+        elif not self.make_unmake:
+            calcstate = root.state
 
         for iteration in range(self.expansion_count):
 
-            print(f"({iteration}/{self.expansion_count}), {self.max_depth}", end="\r")
+            if self.verbose:
+                print(f"({iteration}/{self.expansion_count}), {self.max_depth}", end="\r")
+            if self.make_unmake:
+                self._iterate_make_unmake(root, calcstate)
+                continue
             node = root
             depth = 0
-            while (not node.state.over) and node.fully_expanded:
+            while (not node.over) and node.fully_expanded:
                 # print(node.state)
                 # print(node.untried[-5:])
                 depth += 1
@@ -50,7 +219,7 @@ class BaseMCTSbot(Player):
             if depth > self.max_depth:
                 self.max_depth = depth
             
-            if (not node.state.over) and node.untried:
+            if (not node.over) and node.untried:
                 move = node.untried.pop(random.randrange(len(node.untried)))
                 child_state = node.state.get_clone()
                 child_state.play_move(move)
@@ -62,18 +231,258 @@ class BaseMCTSbot(Player):
                 # print(node.state)
                 # print(node.untried[-5:])
 
-            value = 1 if self._rollout_to_terminal(node.state) else 0
+            value = self._rollout_leaf(node.state)
 
-            self._backprop(node, value)
+            self._backprop(node, value, self.rollouts_per_leaf)
             
         best_move = max(root.children.items(), key=lambda kv: kv[1].N)[0]
 
-
+        self.root, self.root_state, self.last_move = root, calcstate, best_move
         return best_move
+
+    def _book_move(self, calcstate):
+        #the opening book's move for calcstate if it is confident in one, the tree of the last search is then dropped
+        if self.opening_book is None:
+            return None
+        move = self.opening_book.choose(calcstate)
+        if move is not None:
+            self.book_moves += 1
+            self.root, self.last_move = None, move
+            if self.verbose:
+                print(f"book move {move}")
+        return move
+
+    def _endgame_move(self, calcstate):
+        #the endgame solver's move for a two player position without walls left, the last search's tree is then dropped
+        if self.endgame is None:
+            return None
+        solution = self.endgame.get_move(calcstate)
+        if solution is None or solution[0] is None:
+            return None
+        move, value, plies = solution
+        self.endgame_moves += 1
+        self.root, self.last_move = None, move
+        if self.verbose:
+            print(f"endgame move {move}: {('loss', 'draw', 'win')[value + 1]} in {plies} plies")
+        return move
+
+    def _endgame_value(self, state, solve = True):
+        '''
+        Returns:
+            the exact result for this bot's player (1, 0.5 or 0) of a position the endgame solver covers, None if it
+            does not or, without solve, if the position's wall layout has not been solved yet
+        '''
+        endgame = self.endgame
+        if endgame is None or not endgame.covers(state) or not (solve or endgame.has_table(state)):
+            return None
+        return endgame.get_win_probability(state, self.player_id)
+
+    def get_root_statistics(self):
+        '''
+        Returns:
+            dict of move -> (N, W) of the root's children after the last choose_move, empty if it did not search
+            (no call yet, or a book or endgame move)
+        '''
+        if self.root is None:
+            return {}
+        stats = {}
+        seen = set()
+        for move, child in self.root.children.items():
+            if self.use_transpositions:
+                #one move per canonical child, mirror image moves share its visits
+                if child in seen:
+                    continue
+                seen.add(child)
+                child = self.table.peek(child)
+                if child is None:
+                    continue
+            stats[from_canonical(self.root_symmetry, move)] = (child.N, child.W)
+        return stats
+
+    def _reuse_root(self, calcstate):
+        '''
+        Looks for calcstate's position below the move chosen last call (our move followed by one reply of every other
+        player) and detaches that node as the new root. Everything else of the old tree is dropped.
+
+        Returns:
+            the new root node, or None if the position was not searched (or reuse is off)
+        '''
+        root, state, self.root, self.root_state = self.root, self.root_state, None, None
+        if not self.reuse_tree or root is None:
+            return None
+        child = root.children.get(self.last_move)
+        if child is None:
+            return None
+        record = state.make_move(self.last_move)
+        found = find_subtree(child, state, calcstate.get_hash(), calcstate.player_count - 1)
+        state.undo_move(record)
+        if found is not None:
+            found.parent = None
+        return found
         
 
 
 
+    def _iterate_make_unmake(self, root, state):
+        '''
+        One search iteration on a single state: selection and expansion play moves on state, the rollout runs on
+        one clone of the leaf, then the undo records take state back to the root position.
+        '''
+        records = []
+        node = root
+        while (not node.over) and node.fully_expanded:
+            node = self._select_uct(node)
+            records.append(state.make_move(node.move_from_parent))
+        if len(records) > self.max_depth:
+            self.max_depth = len(records)
+
+        if (not node.over) and node.untried:
+            move = node.untried.pop(random.randrange(len(node.untried)))
+            records.append(state.make_move(move))
+            child = BaseMCTSnode(state, node, move, False)
+            node.children[move] = child
+            node = child
+
+        value = self._rollout_leaf(state)
+        self._backprop(node, value, self.rollouts_per_leaf)
+
+        for record in reversed(records):
+            state.undo_move(record)
+
+    ########################  Transposition (DAG) search  #########################
+
+    def _choose_move_transpositions(self, calcstate):
+        self.transposition_hits = 0
+        root_hash, root_symmetry = self._table_key(calcstate)
+        root = self.table.get(root_hash) if self.reuse_tree else None
+        if root is None:
+            self.table.clear()
+            root = TranspositionNode(calcstate, root_symmetry)
+            self.table.put(root_hash, root)
+        else:
+            self._prune_table(root_hash)
+
+        for iteration in range(self.expansion_count):
+            if self.verbose:
+                print(f"({iteration}/{self.expansion_count}), {self.max_depth}", end="\r")
+            #touching the root every iteration keeps it the most recently used entry, so it is never evicted
+            self.table.get(root_hash)
+            self._iterate_transpositions(root, root_hash, root_symmetry, calcstate)
+
+        best_move, best_N = None, -1
+        for move, h in root.children.items():
+            child = self.table.peek(h)
+            if child is not None and child.N > best_N:
+                best_move, best_N = move, child.N
+        best_move = from_canonical(root_symmetry, best_move)
+        self.root, self.root_symmetry, self.last_move = root, root_symmetry, best_move
+        return best_move
+
+    def _table_key(self, state):
+        #(table hash, symmetry to the orientation the node's moves are kept in) of state
+        if self.use_symmetry:
+            return state.get_canonical()
+        return state.get_hash(), None
+
+    def _prune_table(self, root_hash):
+        #keeps only the positions still reachable from the new root
+        reachable = {root_hash}
+        frontier = [root_hash]
+        while frontier:
+            node = self.table.peek(frontier.pop())
+            for h in node.children.values():
+                if h not in reachable and h in self.table:
+                    reachable.add(h)
+                    frontier.append(h)
+        self.table.retain(reachable)
+
+    def _iterate_transpositions(self, root, root_hash, root_symmetry, state):
+        '''
+        One make/unmake iteration over the DAG. The visited nodes are collected on the way down and all of them get the
+        rollout result (no parent pointers). Positions repeat in Quoridor, so the descent stops when it meets a position
+        already on its own path instead of going round the cycle.
+        Node moves are canonical (see use_symmetry), symmetry follows the state down to map them to the moves it plays.
+        '''
+        records = []
+        path = [root]
+        on_path = {root_hash}
+        node = root
+        symmetry = root_symmetry
+        while (not node.over) and not node.untried:
+            move, h, child = self._select_uct_transpositions(node)
+            if child is None:
+                break
+            records.append(state.make_move(from_canonical(symmetry, move)))
+            if self.use_symmetry:
+                symmetry = state.get_canonical()[1]
+            node = child
+            #a position already on the path is not added again, its statistics are updated once per iteration
+            if h in on_path:
+                break
+            path.append(node)
+            on_path.add(h)
+        if len(records) > self.max_depth:
+            self.max_depth = len(records)
+
+        if (not node.over) and node.untried:
+            move = node.untried.pop(random.randrange(len(node.untried)))
+            records.append(state.make_move(from_canonical(symmetry, move)))
+            h, child_symmetry = self._table_key(state)
+            child = self.table.get(h)
+            if child is None:
+                child = TranspositionNode(state, child_symmetry)
+                self.table.put(h, child)
+            else:
+                self.transposition_hits += 1
+            #mirror image moves of a symmetric position lead to one canonical child, only the first of them gets the edge
+            #so the child's visits are not counted once per move
+            if h not in node.children.values():
+                node.children[move] = h
+            if h not in on_path:
+                path.append(child)
+
+        value = self._rollout_leaf(state)
+        count = self.rollouts_per_leaf
+        for n in path:
+            n.N += count
+            n.W += value
+
+        for record in reversed(records):
+            state.undo_move(record)
+
+    def _select_uct_transpositions(self, node):
+        '''
+        _select_uct over the children of a DAG node. Children whose position has been evicted from the table go back
+        to the untried moves, in which case nothing is selected and the caller expands instead.
+
+        Returns:
+            (move, position hash, node) of the selected child, or (None, None, None)
+        '''
+        parent_N = node.N
+        c = self.c_uct
+        table = self.table
+        best, best_score = (None, None, None), -1e100
+        evicted = []
+        for move, h in node.children.items():
+            child = table.peek(h)
+            if child is None:
+                evicted.append(move)
+                continue
+            u = c * math.sqrt(max(1.0, math.log(parent_N))) / (1 + child.N)
+            score = child.q + u
+            if score > best_score:
+                best_score, best = score, (move, h, child)
+        if evicted:
+            for move in evicted:
+                del node.children[move]
+                node.untried.append(move)
+            return None, None, None
+        if best[2] is not None:
+            table.get(best[1])
+        return best
+
+    ###############################  Shared  ####################################
+
     def _select_uct(self, node):
         parent_N = node.N
         c = self.c_uct
@@ -88,21 +497,82 @@ class BaseMCTSbot(Player):
         return best_child
 
 
-    def _rollout_to_terminal(self, state):
-        s: Calcstate = state.get_clone()
+    def _rollout_leaf(self, state, stats = None):
+        '''
+        Runs rollouts_per_leaf playouts from state, in this process or shared out over the rollout pool
+
+        Args:
+            stats: rollout counters to add to (see rollout_stats, the default)
+
+        Returns:
+            summed results of the playouts for this bot's player (1 per win, a static estimate for capped ones)
+        '''
+        count = self.rollouts_per_leaf
+        if stats is None:
+            stats = self.rollout_stats
+        value = self._endgame_value(state)
+        if value is not None:
+            stats["rollouts"] += count
+            stats["solved"] += count
+            return value * count
+        if self.rollout_engine == "batch":
+            batch = BatchRollout.from_states([state], copies = count)
+            batch.run(self.rollout_cap)
+            stats["rollouts"] += count
+            stats["capped"] += int((~batch.over).sum())
+            return float(batch.get_win_probabilities(self.player_id).sum())
+        if count == 1:
+            return self._rollout_to_terminal(state, stats)
+        if not self.rollout_workers:
+            return sum(self._rollout_to_terminal(state, stats) for _ in range(count))
+        data = state.serialize()
+        workers = min(self.rollout_workers, count)
+        tasks = [(data, random.getrandbits(64), self.player_id, count // workers + (i < count % workers)) for i in range(workers)]
+        results = self.get_rollout_pool().map(_rollout_worker, tasks)
+        stats["rollouts"] += count
+        stats["capped"] += sum(capped for _, capped, _ in results)
+        stats["solved"] += sum(solved for _, _, solved in results)
+        return sum(value for value, _, _ in results)
+
+    def _rollout_to_terminal(self, state, stats = None):
+        '''
+        Plays one rollout from state with the bot's rollout policy, for at most rollout_cap plies
+
+        Args:
+            stats: rollout counters to add to (see rollout_stats, the default)
+
+        Returns:
+            1 if this bot's player won, 0 if not, the static win probability if the cap was reached first,
+            the endgame solver's result once the walls run out (see endgame_oracle)
+        '''
+        if stats is None:
+            stats = self.rollout_stats
+        s: Calcstate = state.get_clone(private = True)
+        stats["rollouts"] += 1
+        solve = self.endgame_oracle == "always"
+        plies = 0
         while not s.over:
-            moves = s.get_legal_moves()
-            if not moves:
+            if self.rollout_cap is not None and plies >= self.rollout_cap:
+                stats["capped"] += 1
+                return s.get_static_eval(self.player_id)
+            m = s.get_rollout_move(self.rollout_policy, **self.rollout_weights)
+            if m is None:
                 break
-            m = random.choice(moves)
             s.play_move(m)
+            if s.wall_count == 0:
+                value = self._endgame_value(s, solve)
+                if value is not None:
+                    stats["solved"] += 1
+                    return value
             s.try_early_eval()
-        return s.winner == self.player_id
+            plies += 1
+        return 1 if s.winner == self.player_id else 0
     
-    def _backprop(self, node, value_from_me):
+    def _backprop(self, node, value_from_me, count = 1):
+        #value_from_me is the summed result of count rollouts (wins, or win probabilities for capped ones)
         n = node
         while n is not None:
-            n.N += 1
+            n.N += count
             n.W += value_from_me
             n = n.parent
         
@@ -0,0 +1,336 @@
+'''
+Random playouts of many games at once in NumPy arrays, advanced in lockstep one ply per step.
+
+The rules are those of Gamestate.play_move followed by Calcstate.try_early_eval, and every step picks a uniformly
+random legal move like Calcstate.get_random_move:
+    - an option is drawn uniformly from the pawn moves and the physically open placements (if the player has walls left)
+    - a drawn placement that touches existing walls (or the board edge) at two points could close a pocket, so it is
+      tried on a copy of the walls with a breadth first search of every player's goal field, for all such games at
+      once (placements touching at most one point are always legal). If it cuts a player off it is struck from that
+      game's options and the game draws again from the rest, so the accepted move is uniform over the legal moves.
+    - games stop when a pawn reaches its goal, when early evaluation decides them (no walls left and one player 3 or
+      more steps ahead) or when the player up has no legal move at all (no winner, as in the python rollouts)
+
+Per game state (N games, P players, squares indexed 9*y + x):
+    walls         (N, 81) N/E/S/W wall nibbles with the board edges set (grid gives them as (N, 9, 9), rows are y)
+    positions     (N, P) pawn squares
+    player_walls  (N, P) walls left per player
+    player_up     (N,)
+    open          (N, 128) placements not yet blocked by a placed wall (legality is checked when drawn)
+    fields        (N, P, 81) goal distance of every square, UNREACHABLE if walled off. Only early evaluation reads them,
+                  so they are rebuilt when a game's last wall is placed rather than after every placement
+    over, winner  (N,) winner is -1 while a game is running or if it ended without one
+'''
+
+import numpy as np
+import random, time
+from moves import PAWN_BASE, JUMP_BASE, PLACEMENT_COUNT, PLACEMENTS, PHYSICAL_CONFLICTS
+from grid import SquareGrid
+from move_tables import STEPS, JUMPS
+from bitgrid import GOAL_MASKS
+from distance_field import UNREACHABLE
+from calcstate import Calcstate, WALL_CELLS, win_probabilities
+
+############################  Static tables  ##################################
+
+# STEP_TO[s, bits, d]: square one step from s in direction d (N E S W) when s has wall nibble bits, -1 if closed
+STEP_TO = np.full((81, 16, 4), -1, np.int16)
+for _s in range(81):
+    for _bits in range(16):
+        for _d, _n in STEPS[_s][_bits]:
+            STEP_TO[_s, _bits, _d] = _n
+
+# JUMP_CODES[n, bits, d]: up to 3 jump move codes over a pawn on n (nibble bits) entered from direction d, -1 padded
+JUMP_CODES = np.full((81, 16, 4, 3), -1, np.int16)
+for _n in range(81):
+    for _bits in range(16):
+        for _d in range(4):
+            _codes = JUMPS[_n][_bits][_d]
+            JUMP_CODES[_n, _bits, _d, :len(_codes)] = _codes
+
+# placement code -> the 4 squares it walls and the side bit set on each
+WALL_SQUARES = np.array([[s for s, _ in cells] for cells in WALL_CELLS], np.int16)
+WALL_FACES = np.array([[face for _, face in cells] for cells in WALL_CELLS], np.uint8)
+
+# placement code -> the placements it rules out physically, padded with the code itself
+CONFLICTS = np.array([conflicts + (conflicts[0],) * (4 - len(conflicts)) for conflicts in PHYSICAL_CONFLICTS], np.int16)
+
+# placement code -> its 3 touch groups (see SquareGrid.get_touch_groups) as up to 3 (square, side bit) cells each,
+# padded with side bit 0 which never matches
+TOUCH_SQUARES = np.zeros((PLACEMENT_COUNT, 3, 3), np.int16)
+TOUCH_FACES = np.zeros((PLACEMENT_COUNT, 3, 3), np.uint8)
+for _c, _placement in enumerate(PLACEMENTS):
+    for _g, _group in enumerate(SquareGrid.get_touch_groups(_placement)):
+        for _i, (_x, _y, _face) in enumerate(_group):
+            TOUCH_SQUARES[_c, _g, _i] = 9 * _y + _x
+            TOUCH_FACES[_c, _g, _i] = _face
+
+GOAL_SQUARES = np.array([[mask >> s & 1 for s in range(81)] for mask in GOAL_MASKS], bool)
+
+
+def goal_fields(walls, player_count):
+    '''
+    Breadth first search from every player's goal squares in every game at once (one layer per loop).
+
+    Args:
+        walls: (M, 81) wall nibbles
+        player_count: fields are built for goals 0 to player_count - 1
+
+    Returns:
+        (M, player_count, 81) uint8 distances
+    '''
+    open_n = (walls & 1 == 0)[:, None, :]
+    open_e = (walls & 2 == 0)[:, None, :]
+    open_s = (walls & 4 == 0)[:, None, :]
+    open_w = (walls & 8 == 0)[:, None, :]
+    M = len(walls)
+    fields = np.full((M, player_count, 81), UNREACHABLE, np.uint8)
+    frontier = np.repeat(GOAL_SQUARES[None, :player_count], M, axis=0)
+    reach = frontier.copy()
+    k = 0
+    while frontier.any():
+        fields[frontier] = k
+        grown = np.zeros_like(frontier)
+        #square s joins if the neighbour it has an open edge to is in the frontier
+        grown[..., :72] |= frontier[..., 9:] & open_n[..., :72]
+        grown[..., 9:] |= frontier[..., :72] & open_s[..., 9:]
+        grown[..., :80] |= frontier[..., 1:] & open_e[..., :80]
+        grown[..., 1:] |= frontier[..., :80] & open_w[..., 1:]
+        frontier = grown & ~reach
+        reach |= frontier
+        k += 1
+    return fields
+
+
+def nth_true(mask, n):
+    #column of the nth (0 based) True of every row of a 2d bool array
+    return np.argmax(np.cumsum(mask, axis=1) > n[:, None], axis=1)
+
+
+class BatchRollout:
+    def __init__(self, walls, positions, player_walls, player_up, open, fields, seed = None):
+        '''
+        Takes the per game arrays described in the module docstring (they are used in place).
+        seed seeds the NumPy generator, by default it is drawn from the random module so seeding that repeats runs.
+        '''
+        self.walls = walls
+        self.positions = positions
+        self.player_walls = player_walls
+        self.player_up = player_up
+        self.open = open
+        self.fields = fields
+        self.game_count, self.player_count = positions.shape
+        self.over = np.zeros(self.game_count, bool)
+        self.winner = np.full(self.game_count, -1, np.int8)
+        self.last_moves = np.full(self.game_count, -1, np.int16)
+        self.plies = 0
+        self.rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+
+    @classmethod
+    def from_states(cls, states, copies = 1, seed = None):
+        '''
+        Builds a batch from gamestates (all with the same player count), each repeated copies times in a row
+
+        Args:
+            states: list of Gamestate / Calcstate objects
+            copies: number of games started from each state
+        '''
+        walls = np.array([[state.grid.get_wall_bits(s) for s in range(81)] for state in states], np.uint8)
+        positions = np.array([[9 * y + x for x, y in state.player_positions] for state in states], np.int16)
+        player_walls = np.array([state.player_walls for state in states], np.int16)
+        player_up = np.array([state.player_up for state in states], np.int16)
+        # placements not physically blocked: the open ones plus those only flagged illegal for now
+        open = np.array([[(state.open_mask | state.grid.get_illegal_mask()) >> c & 1 for c in range(PLACEMENT_COUNT)]
+                         for state in states], bool)
+        fields = np.array([[np.frombuffer(field.dist, np.uint8) for field in state.dists] for state in states], np.uint8)
+        batch = cls(*(np.repeat(a, copies, axis=0) for a in (walls, positions, player_walls, player_up, open, fields)), seed = seed)
+        over = np.repeat([state.over for state in states], copies)
+        winner = np.repeat([-1 if state.winner is None else state.winner for state in states], copies)
+        batch.over[:] = over
+        batch.winner[:] = winner
+        return batch
+
+    @property
+    def grid(self):
+        return self.walls.reshape(self.game_count, 9, 9)
+
+    ############################  Stepping  ##################################
+
+    def run(self, max_plies = None):
+        '''
+        Steps until every game is over (or max_plies steps have been played)
+
+        Returns:
+            (N,) int8 array of winners, -1 for games without one
+        '''
+        while not self.over.all():
+            if max_plies is not None and self.plies >= max_plies:
+                break
+            self.step()
+        return self.winner
+
+    def step(self):
+        #plays one random legal move in every running game
+        games = np.flatnonzero(~self.over)
+        self.last_moves[:] = -1
+        if games.size == 0:
+            return
+        self.plies += 1
+        rows = np.arange(games.size)
+        up = self.player_up[games]
+
+        pawn_codes = self.get_pawn_codes(games, up)
+        pawn_valid = pawn_codes >= 0
+        candidates = self.open[games] & (self.player_walls[games, up] > 0)[:, None]
+
+        moves = np.full(games.size, -1, np.int16)
+        pending = rows
+        while pending.size:
+            pawn_count = pawn_valid[pending].sum(axis=1)
+            total = pawn_count + candidates[pending].sum(axis=1)
+            # no legal move left to draw: the game ends without a winner
+            stuck = pending[total == 0]
+            self.over[games[stuck]] = True
+            keep = total > 0
+            pending, pawn_count, total = pending[keep], pawn_count[keep], total[keep]
+            if pending.size == 0:
+                break
+
+            pick = (self.rng.random(pending.size) * total).astype(np.int64)
+            is_pawn = pick < pawn_count
+            pawn_rows = pending[is_pawn]
+            moves[pawn_rows] = pawn_codes[pawn_rows, nth_true(pawn_valid[pawn_rows], pick[is_pawn])]
+
+            wall_rows = pending[~is_pawn]
+            codes = nth_true(candidates[wall_rows], pick[~is_pawn] - pawn_count[~is_pawn])
+            legal = self.try_placements(games[wall_rows], up[wall_rows], codes)
+            moves[wall_rows[legal]] = codes[legal]
+            candidates[wall_rows[~legal], codes[~legal]] = False
+            pending = wall_rows[~legal]
+
+        self.last_moves[games] = moves
+        pawn_rows = np.flatnonzero(moves >= PAWN_BASE)
+        self.play_pawns(games[pawn_rows], up[pawn_rows], moves[pawn_rows])
+        self.evaluate_early(games)
+        self.player_up[games] = (up + 1) % self.player_count
+
+    def get_pawn_codes(self, games, up):
+        '''
+        Pawn move codes of the player up in each game, in the same order as Gamestate.get_legal_pawn_moves
+
+        Returns:
+            (M, 12) int16 array, 3 slots per direction, -1 where there is no move
+        '''
+        rows = np.arange(games.size)
+        positions = self.positions[games]
+        walls = self.walls[games]
+        squares = positions[rows, up]
+        neighbors = STEP_TO[squares, walls[rows, squares]]
+        occupied = np.zeros((games.size, 81), bool)
+        occupied[rows[:, None], positions] = True
+        # a pawn's own square is never one of its neighbours, so only the other pawns count here
+        clipped = np.maximum(neighbors, 0)
+        jumping = (neighbors >= 0) & occupied[rows[:, None], clipped]
+
+        codes = np.full((games.size, 4, 3), -1, np.int16)
+        codes[:, :, 0] = np.where(neighbors >= 0, PAWN_BASE + neighbors, -1)
+        jumps = JUMP_CODES[clipped, walls[rows[:, None], clipped], np.arange(4)[None, :]]
+        codes = np.where(jumping[:, :, None], jumps, codes)
+        return codes.reshape(games.size, 12)
+
+    def try_placements(self, games, up, codes):
+        '''
+        Places codes[i] in games[i] if every player can still reach their goal, and updates the walls left and
+        the open placements of the games where it was legal (and their goal fields once no walls remain).
+
+        Returns:
+            (M,) bool array, True where the placement was played
+        '''
+        if games.size == 0:
+            return np.zeros(0, bool)
+        rows = np.arange(games.size)
+        walls = self.walls[games]
+        touched = (walls[rows[:, None, None], TOUCH_SQUARES[codes]] & TOUCH_FACES[codes]).any(axis=2)
+        walls[rows[:, None], WALL_SQUARES[codes]] |= WALL_FACES[codes]
+
+        legal = np.ones(games.size, bool)
+        check = np.flatnonzero(touched.sum(axis=1) >= 2)
+        if check.size:
+            fields = goal_fields(walls[check], self.player_count)
+            reached = fields[np.arange(check.size)[:, None], np.arange(self.player_count)[None, :], self.positions[games[check]]]
+            legal[check] = (reached != UNREACHABLE).all(axis=1)
+
+        played = games[legal]
+        self.walls[played] = walls[legal]
+        self.open[played[:, None], CONFLICTS[codes[legal]]] = False
+        self.player_walls[played, up[legal]] -= 1
+        finished = played[self.player_walls[played].sum(axis=1) == 0]
+        if finished.size:
+            self.fields[finished] = goal_fields(self.walls[finished], self.player_count)
+        return legal
+
+    def play_pawns(self, games, up, codes):
+        #moves the pawns and ends the games whose mover reached their goal
+        destinations = np.where(codes < JUMP_BASE, codes - PAWN_BASE, (codes - JUMP_BASE) % 81)
+        self.positions[games, up] = destinations
+        won = GOAL_SQUARES[up, destinations]
+        self.over[games[won]] = True
+        self.winner[games[won]] = up[won]
+
+    def evaluate_early(self, games):
+        #Calcstate.evaluate_early(3) for the running games that have no walls left
+        games = games[~self.over[games] & (self.player_walls[games].sum(axis=1) == 0)]
+        if games.size == 0:
+            return
+        rows = np.arange(games.size)
+        lengths = self.fields[games[:, None], np.arange(self.player_count)[None, :], self.positions[games]].astype(np.int16)
+        leader = np.argmin(lengths, axis=1)
+        ordered = np.sort(lengths, axis=1)
+        decided = ordered[:, 0] <= ordered[:, 1] - 3
+        self.over[games[decided]] = True
+        self.winner[games[decided]] = leader[decided]
+
+    def get_win_probabilities(self, player):
+        '''
+        player's result in every game: 1 or 0 for finished games, the static estimate of calcstate.win_probabilities
+        for games still running (after run(max_plies) stopped them)
+
+        Returns:
+            (N,) float array
+        '''
+        values = (self.winner == player).astype(float)
+        running = np.flatnonzero(~self.over)
+        if running.size:
+            # the fields of games with walls left are stale, so they are recomputed here
+            fields = goal_fields(self.walls[running], self.player_count)
+            lengths = fields[np.arange(running.size)[:, None], np.arange(self.player_count)[None, :], self.positions[running]]
+            values[running] = win_probabilities(lengths.astype(float), self.player_walls[running], self.player_up[running])[:, player]
+        return values
+
+
+if __name__ == "__main__":
+    # playouts per second of the batch engine against Calcstate rollouts from the starting position
+    random.seed("bagel")
+    start_state = Calcstate()
+    start_state.set_up_as_start(2)
+
+    games = 300
+    start = time.time()
+    wins = 0
+    for _ in range(games):
+        s = start_state.get_clone()
+        while not s.over:
+            m = s.get_random_move()
+            if m is None:
+                break
+            s.play_move(m)
+            s.try_early_eval()
+        wins += s.winner == 0
+    elapsed = time.time() - start
+    print(f"Calcstate: {games / elapsed:.0f} playouts/s, player 0 won {wins / games:.3f}")
+
+    for batch_size in (100, 1000, 5000):
+        start = time.time()
+        winners = BatchRollout.from_states([start_state], copies = batch_size).run()
+        elapsed = time.time() - start
+        print(f"batch of {batch_size}: {batch_size / elapsed:.0f} playouts/s, player 0 won {(winners == 0).mean():.3f}")
@@ -0,0 +1,288 @@
+import numpy as np
+from grid import SquareGrid, COORDS
+from move_tables import ADJACENT, STEP_MOVES, NEIGHBOR_INDICES
+
+# Square s = 9*y + x is stored as bit s of an 81-bit python int.
+# Instead of per square wall bits, the grid keeps one mask per direction holding the squares a pawn can leave
+# in that direction. Board edges are closed from the start, so a shift of an open mask never wraps a row.
+#
+# open_n   squares whose northern edge is open (bit s -> s+9)
+# open_e   squares whose eastern edge is open  (bit s -> s+1)
+# open_s   squares whose southern edge is open (bit s -> s-9)
+# open_w   squares whose western edge is open  (bit s -> s-1)
+# walls    the N/E/S/W wall nibble of every square (bits 4s..4s+3), the same walls as the open masks
+#          packed so one shift answers has_wall and picks the move table entry of a square
+# pawns    squares occupied by a pawn
+# illegal  placements flagged illegal, bit r*64 + 8*y + x (the H/V bits of the array grid)
+# marks    debugging marks
+
+FULL = (1 << 81) - 1
+ROW_0 = 0x1FF
+ROW_8 = ROW_0 << 72
+COL_0 = sum(1 << (9 * y) for y in range(9))
+COL_8 = COL_0 << 8
+
+START_N = FULL ^ ROW_8
+START_E = FULL ^ COL_8
+START_S = FULL ^ ROW_0
+START_W = FULL ^ COL_0
+
+BITS = {coords: 1 << s for s, coords in enumerate(COORDS)}
+
+# goal rows of players 0-3 as square masks (same order as Gamestate.get_starting_goals)
+GOAL_MASKS = (ROW_8, ROW_0, COL_8, COL_0)
+
+
+def to_nibbles(closed_n, closed_e, closed_s, closed_w):
+    #packs square masks of closed sides into the 4 bit per square wall layout
+    walls = 0
+    for s in range(81):
+        walls |= ((closed_n >> s & 1) | (closed_e >> s & 1) << 1 | (closed_s >> s & 1) << 2 | (closed_w >> s & 1) << 3) << (4 * s)
+    return walls
+
+
+START_WALLS = to_nibbles(ROW_8, COL_8, ROW_0, COL_0)
+
+# placement tuple -> (bit in the illegal mask, squares losing N, E, S, W, wall nibbles)
+PLACEMENT_BITS = {}
+for _r in range(2):
+    for _y in range(8):
+        for _x in range(8):
+            _s = 9 * _y + _x
+            _pair_x = (1 << _s) | (1 << (_s + 1))
+            _pair_y = (1 << _s) | (1 << (_s + 9))
+            if _r == 0:
+                _sides = (_pair_x, 0, _pair_x << 9, 0)
+                PLACEMENT_BITS[(_x, _y, _r)] = (1 << (8 * _y + _x),) + _sides + (to_nibbles(*_sides),)
+            else:
+                _sides = (0, _pair_y, 0, _pair_y << 1)
+                PLACEMENT_BITS[(_x, _y, _r)] = (1 << (64 + 8 * _y + _x),) + _sides + (to_nibbles(*_sides),)
+
+# placement tuple -> the three wall groups counted by get_touches, each as (N, E, S, W) square masks
+TOUCH_GROUPS = {}
+_FACE_INDEX = {1: 0, 2: 1, 4: 2, 8: 3}
+for _placement in PLACEMENT_BITS:
+    _groups = []
+    for _group in SquareGrid.get_touch_groups(_placement):
+        _masks = [0, 0, 0, 0]
+        for _gx, _gy, _face in _group:
+            _masks[_FACE_INDEX[_face]] |= 1 << (9 * _gy + _gx)
+        _groups.append(tuple(_masks))
+    TOUCH_GROUPS[_placement] = tuple(_groups)
+
+
+def coords_to_mask(squares):
+    mask = 0
+    for square in squares:
+        mask |= BITS[square]
+    return mask
+
+
+class BitboardGrid(SquareGrid):
+    '''
+    Drop in replacement for SquareGrid that keeps the board in a handful of python ints.
+    Scalar queries become a shift and a mask and connectivity is a bit parallel flood fill.
+    The array view (arr) is rebuilt on demand for display and legacy code and is read only.
+    '''
+
+    def get_clone(self):
+        clone = BitboardGrid.__new__(BitboardGrid)
+        clone.open_n = self.open_n
+        clone.open_e = self.open_e
+        clone.open_s = self.open_s
+        clone.open_w = self.open_w
+        clone.walls = self.walls
+        clone.pawns = self.pawns
+        clone.illegal = self.illegal
+        clone.marks = self.marks
+        return clone
+
+    def set_up_from_start(self):
+        self.open_n = START_N
+        self.open_e = START_E
+        self.open_s = START_S
+        self.open_w = START_W
+        self.walls = START_WALLS
+        self.pawns = 0
+        self.illegal = 0
+        self.marks = 0
+
+    def snapshot(self):
+        #the masks are immutable ints, so the tuple is the whole grid state
+        return (self.open_n, self.open_e, self.open_s, self.open_w, self.walls, self.pawns, self.illegal, self.marks)
+
+    def restore(self, snapshot):
+        self.open_n, self.open_e, self.open_s, self.open_w, self.walls, self.pawns, self.illegal, self.marks = snapshot
+
+    @classmethod
+    def from_array(cls, arr):
+        '''builds a bitboard grid from a 9x9 array in the SquareGrid layout'''
+        grid = cls()
+        grid.set_up_from_start()
+        open_n = open_e = open_s = open_w = pawns = marks = illegal = 0
+        for s, (x, y) in enumerate(COORDS):
+            v = int(arr[x, y])
+            bit = 1 << s
+            if not v & 1: open_n |= bit
+            if not v & 2: open_e |= bit
+            if not v & 4: open_s |= bit
+            if not v & 8: open_w |= bit
+            if v & 64: pawns |= bit
+            if v & 128: marks |= bit
+            if x < 8 and y < 8:
+                if v & 16: illegal |= 1 << (8 * y + x)
+                if v & 32: illegal |= 1 << (64 + 8 * y + x)
+        grid.open_n, grid.open_e, grid.open_s, grid.open_w = open_n, open_e, open_s, open_w
+        grid.walls = to_nibbles(FULL ^ open_n, FULL ^ open_e, FULL ^ open_s, FULL ^ open_w)
+        grid.pawns, grid.marks, grid.illegal = pawns, marks, illegal
+        return grid
+
+    @property
+    def arr(self):
+        arr = np.zeros((9, 9), dtype=np.uint8)
+        for s, (x, y) in enumerate(COORDS):
+            v = self.walls >> (4 * s) & 15
+            if self.pawns >> s & 1: v |= 64
+            if self.marks >> s & 1: v |= 128
+            if x < 8 and y < 8:
+                if self.illegal >> (8 * y + x) & 1: v |= 16
+                if self.illegal >> (64 + 8 * y + x) & 1: v |= 32
+            arr[x, y] = v
+        return arr
+
+    def is_illegal(self, placement):
+        bits = PLACEMENT_BITS.get(placement)
+        if bits is None:
+            return 0
+        return self.illegal & bits[0]
+
+    def mark_illegal(self, placement):
+        self.illegal |= PLACEMENT_BITS[placement][0]
+
+    def unmark_illegal(self, placement):
+        self.illegal &= ~PLACEMENT_BITS[placement][0]
+
+    def block_single(self, coords, side):
+        bit = BITS[coords]
+        if side == 1: self.open_n &= ~bit
+        elif side == 2: self.open_e &= ~bit
+        elif side == 4: self.open_s &= ~bit
+        elif side == 8: self.open_w &= ~bit
+        self.walls |= side << (4 * (bit.bit_length() - 1))
+
+    def unblock_single(self, coords, side):
+        bit = BITS[coords]
+        if side == 1: self.open_n |= bit & START_N
+        elif side == 2: self.open_e |= bit & START_E
+        elif side == 4: self.open_s |= bit & START_S
+        elif side == 8: self.open_w |= bit & START_W
+        self.walls &= ~(side << (4 * (bit.bit_length() - 1))) | START_WALLS
+
+    def add_wall(self, placement):
+        _, n, e, s, w, nibbles = PLACEMENT_BITS[placement]
+        self.open_n &= ~n
+        self.open_e &= ~e
+        self.open_s &= ~s
+        self.open_w &= ~w
+        self.walls |= nibbles
+
+    def remove_wall(self, placement):
+        _, n, e, s, w, nibbles = PLACEMENT_BITS[placement]
+        self.open_n |= n
+        self.open_e |= e
+        self.open_s |= s
+        self.open_w |= w
+        self.walls &= ~nibbles
+
+    def has_wall(self, x, y, face):
+        return self.walls >> (4 * (9 * y + x)) & face
+
+    def remove_pawn(self, coords):
+        self.pawns &= ~BITS[coords]
+
+    def add_pawn(self, coords):
+        self.pawns |= BITS[coords]
+
+    def mark(self, coords):
+        self.marks |= BITS[coords]
+
+    def is_occupied(self, coord):
+        return self.pawns & BITS[coord]
+
+    def get_touches(self, placement):
+        open_n, open_e, open_s, open_w = self.open_n, self.open_e, self.open_s, self.open_w
+        touches = 0
+        for n, e, s, w in TOUCH_GROUPS[placement]:
+            if (n & ~open_n) or (e & ~open_e) or (s & ~open_s) or (w & ~open_w):
+                touches += 1
+                if touches == 2:
+                    break
+        return touches
+
+    def clear(self, coords):
+        self.marks &= ~BITS[coords]
+
+    def clear_all(self):
+        self.marks = 0
+
+    def get_neighbors(self, p):
+        x, y = p
+        s = 9 * y + x
+        return list(STEP_MOVES[s][self.walls >> (4 * s) & 15])
+
+    def get_wall_bits(self, s):
+        return self.walls >> (4 * s) & 15
+
+    def is_occupied_index(self, s):
+        return self.pawns >> s & 1
+
+    def has_adjacent_pawn(self, s):
+        return self.pawns & ADJACENT[s]
+
+    def get_open_masks(self):
+        return self.open_n, self.open_e, self.open_s, self.open_w
+
+    def get_illegal_mask(self):
+        return self.illegal
+
+    def get_neighbor_indices(self, s):
+        return NEIGHBOR_INDICES[s][self.walls >> (4 * s) & 15]
+
+    def flood(self, reach, stop = 0):
+        '''
+        Grows the square mask reach through open edges until it stops changing or touches stop.
+
+        Returns:
+            the grown mask
+        '''
+        open_n, open_e, open_s, open_w = self.open_n, self.open_e, self.open_s, self.open_w
+        while not reach & stop:
+            grown = (reach | (reach & open_n) << 9 | (reach & open_e) << 1
+                     | (reach & open_s) >> 9 | (reach & open_w) >> 1)
+            if grown == reach:
+                break
+            reach = grown
+        return reach
+
+    def reaches_goal(self, p1, goal_mask):
+        '''
+        Checks whether the pawn square p1 can still reach a square of goal_mask.
+        Only the newly reached squares are pushed through the open edge masks each step, so a call costs
+        a handful of integer ops per step of the shortest route.
+        '''
+        open_n, open_e, open_s, open_w = self.open_n, self.open_e, self.open_s, self.open_w
+        reach = frontier = BITS[p1]
+        while frontier:
+            if frontier & goal_mask:
+                return True
+            grown = ((frontier & open_n) << 9 | (frontier & open_e) << 1
+                     | (frontier & open_s) >> 9 | (frontier & open_w) >> 1)
+            frontier = grown & ~reach
+            reach |= frontier
+        return False
+
+    def are_connected_greedy(self, p1, pset):
+        return self.reaches_goal(p1, coords_to_mask(pset))
+
+    def __repr__(self):
+        return str(self.arr)
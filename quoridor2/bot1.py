@@ -1,12 +1,21 @@
 from player import Player
 from random import choice, shuffle
 from mcts_node import MctsNode as MN
+from calcstate import Calcstate
+from endgame import EndgameSolver
 
 class Bot(Player):
     def __init__(self, calcs):
         self.calcs = calcs
+        self.endgame = EndgameSolver()
         
     def choose_move(self, gamestate):
+        #two player positions without walls left are solved exactly (see endgame.py)
+        calcstate = Calcstate()
+        calcstate.import_gamestate(gamestate)
+        solution = self.endgame.get_move(calcstate)
+        if solution is not None and solution[0] is not None:
+            return solution[0]
         root = MN(gamestate, gamestate.player_up)
         root.get_moves()
         if gamestate.wall_count == 0:
@@ -1,4 +1,5 @@
 from grid import SquareGrid
+from moves import *
 import numpy as np
 from utils import *
 from random import choice, random, seed, randint
@@ -6,6 +7,7 @@ from union_find import *
 import cProfile
 import pstats
 from gamestate import Gamestate
+from symmetry import GAME_SYMMETRIES, KEPT_SYMMETRIES
 
 
 import random
@@ -15,7 +17,7 @@ GRID_SIZE = 9
 N_SQUARES = GRID_SIZE * GRID_SIZE
 MAX_PLAYERS = 4
 MAX_WALLS = 100
-HASH_MASK = 0x7F    # ignore 'mark' bit; consider also ignoring transient bits
+HASH_MASK = 0x0F    # wall bits only: illegal marks follow from walls + positions and pawns are hashed through Z_POS
 
 def r64(): return R.getrandbits(64)
 
@@ -24,21 +26,104 @@ Z_POS   = [[r64() for _ in range(N_SQUARES)] for _ in range(MAX_PLAYERS)]
 Z_TURN  = [r64() for _ in range(MAX_PLAYERS)]
 Z_WALLS = [[r64() for _ in range(MAX_WALLS + 1)] for _ in range(MAX_PLAYERS)]
 
+# placement code -> the four (square index, wall bit) pairs it sets, same cells as SquareGrid.add_wall
+WALL_CELLS = []
+for _x, _y, _r in PLACEMENTS:
+    _s = 9 * _y + _x
+    if _r == 0:
+        WALL_CELLS.append(((_s, 1), (_s + 1, 1), (_s + 9, 4), (_s + 10, 4)))
+    else:
+        WALL_CELLS.append(((_s, 2), (_s + 1, 8), (_s + 9, 2), (_s + 10, 8)))
+
+# symmetry -> the Zobrist keys (grid, pos, turn, walls tables) that hash a position as its image under the symmetry:
+# square s with wall nibble v hashes as Z_GRID[sigma(s)][tau(v)], player p as player pi(p) and so on
+SYMMETRY_KEYS = {}
+for _symmetry in {sym for syms in GAME_SYMMETRIES.values() for sym in syms}:
+    _squares, _nibbles, _players = _symmetry.squares, _symmetry.nibbles, _symmetry.players
+    SYMMETRY_KEYS[_symmetry] = (
+        [[Z_GRID[_squares[_s]][_nibbles[_v]] for _v in range(16)] for _s in range(N_SQUARES)],
+        [[Z_POS[_players[_p]][_squares[_s]] for _s in range(N_SQUARES)] for _p in range(MAX_PLAYERS)],
+        [Z_TURN[_players[_p]] for _p in range(MAX_PLAYERS)],
+        [Z_WALLS[_players[_p]] for _p in range(MAX_PLAYERS)])
+
+# static evaluation (win_probabilities): every player scores minus their path length, plus walls in hand and the
+# tempo of the player up counted in path squares, and the scores go through a softmax (a logistic for 2 players).
+# EVAL_SCALE is about what a logistic fit of path length lead against playout results gives.
+EVAL_SCALE = 0.6
+EVAL_WALL_WEIGHT = 0.25
+EVAL_TEMPO = 0.5
+
+
+def win_probabilities(lengths, player_walls, player_up):
+    '''
+    Static estimate of every player's chance to win, for positions whose playout is cut off
+
+    Args:
+        lengths: (..., P) array of path lengths to goal
+        player_walls: (..., P) array of walls left
+        player_up: (...) array of the player to move
+
+    Returns:
+        (..., P) array of win probabilities
+    '''
+    scores = EVAL_WALL_WEIGHT * player_walls - lengths
+    scores = scores + EVAL_TEMPO * (np.arange(lengths.shape[-1]) == np.expand_dims(player_up, -1))
+    weights = np.exp(EVAL_SCALE * (scores - scores.max(axis=-1, keepdims=True)))
+    return weights / weights.sum(axis=-1, keepdims=True)
+
 class Calcstate(Gamestate):
-    '''Gamestate class expansion with more calculation-related methods'''
+    '''Gamestate class expansion with more calculation-related methods
+
+    Keeps a Zobrist hash of the position (walls, pawn squares, side to move and walls left per player) up to date
+    on every move. It is computed lazily the first time it is needed (_zhash is None until then).
+    The hashes of the position's images under the board symmetries of its game (symmetry.GAME_SYMMETRIES) are kept
+    the same way once get_canonical has asked for them (_symhash, a tuple in GAME_SYMMETRIES order).
+    Set Calcstate.debug_hash = True to check every incremental update against a full _rehash.
+    '''
+
+    __slots__ = ("_zhash", "_symhash")
+
+    debug_hash = False
+
+    def set_up_as_start(self, player_count, total_walls = 20, backend = None):
+        super().set_up_as_start(player_count, total_walls, backend)
+        self._zhash = None
+        self._symhash = None
+
+    def load_serialized(self, data):
+        super().load_serialized(data)
+        self._zhash = None
+        self._symhash = None
+
+    def get_clone(self, private = False):
+        clone = super().get_clone(private)
+        clone._zhash = self._zhash
+        clone._symhash = self._symhash
+        return clone
+
     def import_gamestate(self, gamestate):
+        #takes its own copies of gamestate's containers (like get_clone with private), so the game's gamestate is not
+        #flagged copy on write and the search state does not copy them again on its first move
         self.player_count = gamestate.player_count
         self.over = gamestate.over
         self.player_up = gamestate.player_up
-        self.player_positions = gamestate.player_positions[:]
-        self.player_walls = gamestate.player_walls[:]
-        self.grid = gamestate.grid.get_clone()
-        self.open_placements = gamestate.open_placements.copy()
-        self.goals = gamestate.goals[:]
+        self.player_positions = gamestate.player_positions
+        self.player_walls = gamestate.player_walls
+        self.grid = gamestate.grid
+        self.open_mask = gamestate.open_mask
+        self.goals = gamestate.goals
+        self.goal_masks = gamestate.goal_masks
         self.wall_count = gamestate.wall_count
-        self.paths = [path[:] for path in gamestate.paths]
-        self.blockers = [b.copy() for b in gamestate.blockers]
+        self.dists = gamestate.dists
+        self.paths = gamestate.paths
+        self.blockers = gamestate.blockers
+        self.blockers_twice = gamestate.blockers_twice
+        self.overlap_mask = gamestate.overlap_mask
         self.winner = gamestate.winner
+        self._shared = True
+        self._unshare()
+        self._zhash = gamestate._zhash if isinstance(gamestate, Calcstate) else None
+        self._symhash = gamestate._symhash if isinstance(gamestate, Calcstate) else None
 
     def try_early_eval(self):
         if self.wall_count == 0:
@@ -62,98 +147,277 @@ class Calcstate(Gamestate):
             self.winner = winner
             self.over = True
 
+    def get_static_eval(self, player):
+        '''
+        Win probability of player read off of path lengths and walls left (see win_probabilities), 1 or 0 once over
+        '''
+        if self.over:
+            return 1.0 if self.winner == player else 0.0
+        lengths = np.array([len(path) for path in self.paths], dtype=float)
+        return float(win_probabilities(lengths, np.array(self.player_walls), self.player_up)[player])
+
 
 
 
 
     def get_directist_pawn_move(self):
-        path_move = self.paths[self.player_up][1]
+        path = self.paths[self.player_up]
+        path_move = step_code(path[1])
         legal_moves = self.get_legal_pawn_moves()
         if path_move in legal_moves:
             return path_move
-        jump_move = self.paths[self.player_up][2]
+        if len(path) < 3:
+            return None
         for move in legal_moves:
-            if move[1] == jump_move:
+            if is_jump(move) and move_destination(move) == path[2]:
                 return move
         return None
     
-    def get_rollout_move(self):
+    def get_rollout_move(self, policy = "random", **weights):
+        '''
+        Picks a move for a rollout
+
+        Args:
+            policy: "random" (get_random_move) or "guided" (get_rollout_move_guided)
+            weights: probabilities passed on to the guided policy (favored_prob, favored_pawn, unfavored_pawn)
+
+        Returns:
+            a move code, or None if player_up has no legal move
+        '''
+        if policy == "guided":
+            return self.get_rollout_move_guided(**weights)
         return self.get_random_move()
+
+    def get_rollout_move_guided(self, favored_prob = 0.1, favored_pawn = 0.66, unfavored_pawn = 0.3):
+        '''
+        Rollout policy mixing informed and random moves, informed playouts end in far fewer plies than uniform ones.
+        With probability favored_prob the move is informed: a placement on an opponent's path (get_favorable_placement)
+        or, with probability favored_pawn, the next step along the player's own cached path (get_directist_pawn_move).
+        Otherwise it is a random pawn move with probability unfavored_pawn and a random placement else.
+        A player without walls (or open placements) always takes the informed pawn move, a random walk only drags
+        the playout out.
+
+        Returns:
+            a move code, or None if player_up has no legal move
+        '''
+        can_place = self.player_walls[self.player_up] and self.open_mask
+        if not can_place or random.random() < favored_prob:
+            if can_place and random.random() >= favored_pawn:
+                return self.get_favorable_placement()
+            move = self.get_directist_pawn_move()
+            if move is not None:
+                return move
+        elif can_place and random.random() >= unfavored_pawn:
+            return nth_code(self.open_mask, random.randrange(self.get_placement_count()))
+        pawn_moves = self.get_legal_pawn_moves()
+        if pawn_moves:
+            return random.choice(pawn_moves)
+        return self.get_random_move()
+
+    def get_favorable_placement(self):
+        '''
+        Picks a random open placement that blocks another player's path without blocking player_up's own
+        (from the blocker masks), or any open placement if there is none. open_mask must not be empty.
+        '''
+        others = 0
+        for i in range(self.player_count):
+            if i != self.player_up:
+                others |= self.blockers[i]
+        candidates = others & ~self.blockers[self.player_up] & self.open_mask
+        if not candidates:
+            candidates = self.open_mask
+        return nth_code(candidates, random.randrange(candidates.bit_count()))
     
     def get_random_move(self):
-        return choice(self.get_legal_moves())
+        '''
+        Picks a uniformly random legal move without building the full move list:
+        an index is drawn over placements + pawn moves and placements are read straight off of open_mask.
+
+        Returns:
+            a move code, or None if player_up has no legal move
+        '''
+        placement_count = self.get_placement_count()
+        pawn_moves = self.get_legal_pawn_moves()
+        total = placement_count + len(pawn_moves)
+        if total == 0:
+            return None
+        i = random.randrange(total)
+        if i < placement_count:
+            return nth_code(self.open_mask, i)
+        return pawn_moves[i - placement_count]
     
 
-    def _square_index(x, y):
+    def _square_index(self, x, y):
         return y * 9 + x
     
     def _rehash(self) -> int:
+        self._zhash = self._hash_with(Z_GRID, Z_POS, Z_TURN, Z_WALLS)
+        return self._zhash
+
+    def _rehash_symmetries(self):
+        self._symhash = tuple(self._hash_with(*SYMMETRY_KEYS[sym]) for sym in GAME_SYMMETRIES[self.player_count])
+        return self._symhash
+
+    def _hash_with(self, z_grid, z_pos, z_turn, z_walls):
+        #full hash of the position with the given key tables (the Z_ tables, or the SYMMETRY_KEYS of a symmetry)
+        # 1) walls
         h = 0
-        arr = self.grid.arr
         for y in range(9):
             for x in range(9):
                 s = self._square_index(x, y)
-                v = int(arr[x, y]) & HASH_MASK
-                h ^= Z_GRID[s][v]
+                v = self.grid.get_wall_bits(s) & HASH_MASK
+                h ^= z_grid[s][v]
         # 2) player positions
         for pid, (x, y) in enumerate(self.player_positions):
             s = self._square_index(x, y)
-            h ^= Z_POS[pid][s]
+            h ^= z_pos[pid][s]
         # 3) side to move
-        h ^= Z_TURN[self.player_up]
+        h ^= z_turn[self.player_up]
         # 4) walls remaining
         for pid, w in enumerate(self.player_walls):
-            h ^= Z_WALLS[pid][w]
-        self._zhash = h
+            h ^= z_walls[pid][w]
         return h
-    
+
     def play_move(self, move):
+        '''
+        Plays move (see Gamestate.play_move) and updates the hash with the keys of what it changed
+        '''
+        if type(move) != int:
+            move = encode_move(move)
+        h = self.get_hash()
+        old_symhash = self._symhash
+        p = self.player_up
+        if old_symhash is not None:
+            symhash = [self._move_delta(move, *SYMMETRY_KEYS[sym]) ^ sh
+                       for sym, sh in zip(GAME_SYMMETRIES[self.player_count], old_symhash)]
+        h ^= self._move_delta(move, Z_GRID, Z_POS, Z_TURN, Z_WALLS)
+
         super().play_move(move)
-        self._zhash ^= Z_TURN[self.player_up]
+        up = self.player_up
+        self._zhash = h ^ Z_TURN[p] ^ Z_TURN[up]
+        if old_symhash is not None:
+            self._symhash = tuple(sh ^ SYMMETRY_KEYS[sym][2][p] ^ SYMMETRY_KEYS[sym][2][up]
+                                  for sym, sh in zip(GAME_SYMMETRIES[self.player_count], symhash))
+        if self.debug_hash:
+            self._check_hash()
+
+    def make_move(self, move):
+        '''
+        play_move that also returns an undo record: (the Gamestate record, the hash before the move, the symmetry hashes
+        before the move)
+        '''
+        old_hash, old_symhash = self.get_hash(), self._symhash
+        return (super().make_move(move), old_hash, old_symhash)
+
+    def _move_delta(self, move, z_grid, z_pos, z_turn, z_walls):
+        #keys move changes in the walls and pawn squares (played from the current position, before the turn passes)
+        h = 0
+        p = self.player_up
+        if move < PAWN_BASE:
+            for s, face in WALL_CELLS[move]:
+                bits = self.grid.get_wall_bits(s)
+                h ^= z_grid[s][bits] ^ z_grid[s][bits | face]
+            walls = self.player_walls[p]
+            h ^= z_walls[p][walls] ^ z_walls[p][walls - 1]
+        else:
+            x, y = self.player_positions[p]
+            h ^= z_pos[p][9 * y + x] ^ z_pos[p][move_destination(move)]
+        return h
+
+    def skip_turn(self):
+        old_hash = self.get_hash()
+        old_symhash = self._symhash
+        p = self.player_up
+        record = super().skip_turn()
+        up = self.player_up
+        self._zhash = old_hash ^ Z_TURN[p] ^ Z_TURN[up]
+        if old_symhash is not None:
+            self._symhash = tuple(sh ^ SYMMETRY_KEYS[sym][2][p] ^ SYMMETRY_KEYS[sym][2][up]
+                                  for sym, sh in zip(GAME_SYMMETRIES[self.player_count], old_symhash))
+        if self.debug_hash:
+            self._check_hash()
+        return (record, old_hash, old_symhash)
+
+    def undo_move(self, record):
+        record, old_hash, old_symhash = record
+        super().undo_move(record)
+        self._zhash = old_hash
+        self._symhash = old_symhash
 
     def get_hash(self):
-        if not hasattr(self, "_zhash"):
+        if self._zhash is None:
             return self._rehash()
         return self._zhash
 
+    def get_canonical(self, keep_players = True):
+        '''
+        Hash of the position in its canonical orientation: the smallest hash among the position and its images under
+        the board symmetries of the game (see symmetry.py). Positions that are mirror images of each other share it.
+
+        Args:
+            keep_players: only use symmetries that keep every player in their seat. Statistics kept from a fixed
+                player's point of view (search trees, reply tables) need this, ones from the point of view of the
+                player to move (opening books) can also use the symmetries that swap players.
+
+        Returns:
+            (canonical hash, the symmetry taking the position to its canonical orientation or None for the identity),
+            map moves with symmetry.to_canonical / from_canonical
+        '''
+        best, best_symmetry = self.get_hash(), None
+        symmetries = GAME_SYMMETRIES[self.player_count]
+        if not symmetries:
+            return best, best_symmetry
+        symhash = self._symhash if self._symhash is not None else self._rehash_symmetries()
+        kept = KEPT_SYMMETRIES[self.player_count]
+        for sym, h in zip(symmetries, symhash):
+            if h < best and (not keep_players or sym in kept):
+                best, best_symmetry = h, sym
+        return best, best_symmetry
+
+    def _check_hash(self):
+        h = self._zhash
+        if h != self._rehash():
+            raise Exception(f"incremental hash {h:x} does not match full rehash {self._zhash:x}:\n{self}")
+        symhash = self._symhash
+        if symhash is not None and symhash != self._rehash_symmetries():
+            raise Exception(f"incremental symmetry hashes do not match full rehash:\n{self}")
+
 
 if __name__ == "__main__":
-    seed("bagel")
-    profiler = cProfile.Profile()
-    profiler.enable()  
-
-    for i in range(2000):
-        
-        g  = Calcstate()
-        g.set_up_as_start(2)
-
-        j = 0
-        while not g.over:
-            move = g.get_rollout_move()
-            g.play_move(move)
-            g.try_early_eval()
-            j += 1
-        i += 1
-            
-    profiler.disable()  
-    stats = pstats.Stats(profiler).sort_stats('cumulative')
-    stats.print_stats(25)
-
-
-
-    # def get_favorable_placement(self):
-    #     block_others = {}
-    #     for i in range(self.player_count):
-    #         if i == self.player_up:
-    #             continue
-    #         for blocker in self.blockers[i]:
-    #             if blocker not in block_others:
-    #                 block_others[blocker] = 0
-    #             if blocker in self.blockers[self.player_up]:
-    #                 block_others[blocker] -= 1
-    #             elif blocker in self.open_placements:
-    #                 block_others.add(blocker)
-    #     if len(block_others) > 0:
-    #         return choice(list(block_others))
-    #     else:
-    #         return choice(list(self.open_placements))
\ No newline at end of file
+    # profiles rollouts on every grid backend, QUORIDOR_GRID=numba python calcstate.py profiles the compiled one
+    # (without numba installed its kernels run as plain python)
+    from gamestate import BACKEND_NAMES
+    from compiled_grid import NUMBA_AVAILABLE
+    import os, sys, time
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"numba {'available' if NUMBA_AVAILABLE else 'not installed'}")
+    if NUMBA_AVAILABLE:
+        #compile the kernels before timing
+        g = Calcstate()
+        g.set_up_as_start(2, backend = "numba")
+        g.play_move(g.get_rollout_move())
+
+    timings = {}
+    for backend in BACKEND_NAMES:
+        seed("bagel")
+        profiler = cProfile.Profile()
+        start = time.time()
+        profiler.enable()
+
+        for i in range(games):
+            g = Calcstate()
+            g.set_up_as_start(2, backend = backend)
+
+            while not g.over:
+                move = g.get_rollout_move()
+                g.play_move(move)
+                g.try_early_eval()
+
+        profiler.disable()
+        timings[backend] = time.time() - start
+        if backend == os.environ.get("QUORIDOR_GRID", "bitboard"):
+            stats = pstats.Stats(profiler).sort_stats('cumulative')
+            stats.print_stats(25)
+
+    for backend, elapsed in timings.items():
+        print(f"{backend:>8}: {games / elapsed:.0f} games/s (profiled)")
@@ -0,0 +1,224 @@
+import numpy as np
+from grid import SquareGrid, COORDS
+from moves import PLACEMENTS
+
+# JIT compiled kernels for the SquareGrid hot paths. They work on the raw 9x9 uint8 arr buffer (same bit layout as
+# grid.py) with squares as 9*y + x and fixed size scratch arrays, so numba can compile them in nopython mode.
+# Without numba installed njit leaves the functions as they are and the kernels run as plain python.
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        #stand in for numba.njit, usable bare (@njit) or with options (@njit(cache=True))
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+
+# placement code -> its 3 touch groups (see SquareGrid.get_touch_groups) as up to 3 (x, y, face) rows, x = -1 pads
+TOUCH_TABLE = np.full((128, 3, 3, 3), -1, dtype=np.int64)
+for _code, _placement in enumerate(PLACEMENTS):
+    for _g, _group in enumerate(SquareGrid.get_touch_groups(_placement)):
+        for _i, _cell in enumerate(_group):
+            TOUCH_TABLE[_code, _g, _i] = _cell
+
+PLACEMENT_CODES = {placement: code for code, placement in enumerate(PLACEMENTS)}
+
+# goal square mask -> array of the goal square indices (the few goal rows in use)
+GOAL_SQUARES = {}
+
+
+def goal_squares(goal_mask):
+    squares = GOAL_SQUARES.get(goal_mask)
+    if squares is None:
+        squares = GOAL_SQUARES[goal_mask] = np.array([s for s in range(81) if goal_mask >> s & 1], dtype=np.int64)
+    return squares
+
+
+##############################  Kernels  ###############################
+
+@njit(cache=True)
+def neighbors_kernel(arr, s, out):
+    '''
+    Writes the squares reachable in one step from square s into out (N, E, S, W order, same as get_neighbors)
+
+    Returns:
+        the number of neighbors written
+    '''
+    x = s % 9
+    y = s // 9
+    cell_value = arr[x, y]
+    count = 0
+    if y < 8 and not (cell_value & 1):
+        out[count] = s + 9
+        count += 1
+    if x < 8 and not (cell_value & 2):
+        out[count] = s + 1
+        count += 1
+    if y > 0 and not (cell_value & 4):
+        out[count] = s - 9
+        count += 1
+    if x > 0 and not (cell_value & 8):
+        out[count] = s - 1
+        count += 1
+    return count
+
+
+@njit(cache=True)
+def connected_kernel(arr, target, goals):
+    '''
+    Greedy depth first search from the goal squares to target, the neighbor closest to target is expanded first
+
+    Returns:
+        True if target can reach one of goals
+    '''
+    tx = target % 9
+    ty = target // 9
+    visited = np.zeros(81, dtype=np.bool_)
+    stack = np.empty(405, dtype=np.int64)
+    out = np.empty(4, dtype=np.int64)
+    top = 0
+    for g in goals:
+        stack[top] = g
+        top += 1
+    while top:
+        top -= 1
+        current = stack[top]
+        if current == target:
+            return True
+        if visited[current]:
+            continue
+        visited[current] = True
+        count = neighbors_kernel(arr, current, out)
+        #pushed farthest first so the closest neighbor is popped next
+        for i in range(count):
+            best = i
+            for j in range(i + 1, count):
+                if abs(out[j] % 9 - tx) + abs(out[j] // 9 - ty) > abs(out[best] % 9 - tx) + abs(out[best] // 9 - ty):
+                    best = j
+            out[i], out[best] = out[best], out[i]
+            if not visited[out[i]]:
+                stack[top] = out[i]
+                top += 1
+    return False
+
+
+@njit(cache=True)
+def path_kernel(arr, start, goals, path):
+    '''
+    Breadth first search from the goal squares back to start (all steps cost 1, so this finds a shortest path like
+    the A* of SquareGrid.astar_full_path). Following the parents from start gives the path in start -> goal order.
+
+    Returns:
+        the length of the path written into path (squares including start and the goal), 0 if no goal is reachable
+    '''
+    parent = np.full(81, -1, dtype=np.int64)
+    queue = np.empty(81, dtype=np.int64)
+    out = np.empty(4, dtype=np.int64)
+    head = 0
+    tail = 0
+    for g in goals:
+        if parent[g] == -1:
+            parent[g] = g
+            queue[tail] = g
+            tail += 1
+    while head < tail and parent[start] == -1:
+        current = queue[head]
+        head += 1
+        count = neighbors_kernel(arr, current, out)
+        for i in range(count):
+            neighbor = out[i]
+            if parent[neighbor] == -1:
+                parent[neighbor] = current
+                queue[tail] = neighbor
+                tail += 1
+    if parent[start] == -1:
+        return 0
+    s = start
+    length = 1
+    path[0] = s
+    while parent[s] != s:
+        s = parent[s]
+        path[length] = s
+        length += 1
+    return length
+
+
+@njit(cache=True)
+def touches_kernel(arr, groups):
+    '''
+    Counts the touch groups (rows of TOUCH_TABLE[code]) with a wall on one of their faces, stopping at 2
+    '''
+    touches = 0
+    for g in range(3):
+        for i in range(3):
+            x = groups[g, i, 0]
+            if x == -1:
+                break
+            if arr[x, groups[g, i, 1]] & groups[g, i, 2]:
+                touches += 1
+                break
+        if touches == 2:
+            break
+    return touches
+
+
+@njit(cache=True)
+def open_edges_kernel(arr, out):
+    #out[i, s] is True if the N, E, S, W (i = 0..3) edge of square s is open (see SquareGrid.get_open_masks)
+    for s in range(81):
+        cell_value = arr[s % 9, s // 9]
+        for i in range(4):
+            out[i, s] = not (cell_value >> i & 1)
+
+
+##############################  Grid  ###############################
+
+class CompiledGrid(SquareGrid):
+    '''
+    SquareGrid whose neighbor, connectivity, path, touch and open edge queries run in the kernels above.
+    Select it with Gamestate.set_up_as_start(..., backend = "numba") or QUORIDOR_GRID=numba (see gamestate.py).
+    '''
+
+    def get_clone(self):
+        clone = CompiledGrid()
+        clone.arr = np.copy(self.arr)
+        return clone
+
+    def get_neighbors(self, p):
+        return [COORDS[s] for s in self.get_neighbor_indices(9 * p[1] + p[0])]
+
+    def get_neighbor_indices(self, s):
+        out = np.empty(4, dtype=np.int64)
+        count = neighbors_kernel(self.arr, s, out)
+        return out[:count].tolist()
+
+    def get_open_masks(self):
+        out = np.empty((4, 81), dtype=np.bool_)
+        open_edges_kernel(self.arr, out)
+        return tuple(int.from_bytes(np.packbits(row, bitorder="little").tobytes(), "little") for row in out)
+
+    def get_touches(self, placement):
+        return touches_kernel(self.arr, TOUCH_TABLE[PLACEMENT_CODES[placement]])
+
+    def are_connected_greedy(self, p1, pset):
+        goals = np.array([9 * y + x for x, y in pset], dtype=np.int64)
+        return bool(connected_kernel(self.arr, 9 * p1[1] + p1[0], goals))
+
+    def reaches_goal(self, p1, goal_mask):
+        return bool(connected_kernel(self.arr, 9 * p1[1] + p1[0], goal_squares(goal_mask)))
+
+    def astar_full_path(self, start, goals, as_indices = False):
+        goals = np.array([9 * y + x for x, y in goals], dtype=np.int64)
+        path = np.empty(81, dtype=np.int64)
+        length = path_kernel(self.arr, 9 * start[1] + start[0], goals, path)
+        if not length:
+            return None
+        path = path[:length].tolist()
+        if as_indices:
+            return bytes(path)
+        return [COORDS[s] for s in path]
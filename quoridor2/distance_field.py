@@ -0,0 +1,230 @@
+'''
+Goal distance fields: for one player, the number of steps from every square to the nearest goal square
+(pawns are ignored, like the paths). Squares are indexed by 9*y + x and UNREACHABLE marks squares walled off
+from the goal. Fields keep both the per square distances (for lookups) and the BFS layers as square masks
+(for bit parallel updates).
+
+Walls only ever remove edges, so after a placement distances can only grow. update_field finds the squares
+that lost every downhill neighbour and recomputes just that region instead of redoing the whole search.
+'''
+
+from moves import PLACEMENTS, placement_code
+
+UNREACHABLE = 255
+
+# placement code -> the two square index edges it cuts
+CUT_EDGES = []
+for _x, _y, _r in PLACEMENTS:
+    _s = 9 * _y + _x
+    if _r == 0:
+        CUT_EDGES.append(((_s, _s + 9), (_s + 1, _s + 10)))
+    else:
+        CUT_EDGES.append(((_s, _s + 1), (_s + 9, _s + 10)))
+
+
+class DistanceField:
+    '''
+    dist: bytes of length 81, the distance of every square (UNREACHABLE if walled off)
+    layers: tuple of square masks, layers[k] holds the squares at distance k
+    Treated as immutable so gamestates can share them.
+    '''
+    __slots__ = ("dist", "layers")
+
+    def __init__(self, dist, layers):
+        self.dist = dist
+        self.layers = layers
+
+    def __getitem__(self, s):
+        return self.dist[s]
+
+
+def spread(mask, open_masks):
+    #squares one open edge away from mask
+    n, e, s, w = open_masks
+    return (mask & n) << 9 | (mask & e) << 1 | (mask & s) >> 9 | (mask & w) >> 1
+
+
+def write_mask(dist, mask, value):
+    #sets dist[s] = value for every square bit s of mask
+    while mask:
+        low = mask & -mask
+        dist[low.bit_length() - 1] = value
+        mask ^= low
+
+
+def build_field(grid, goal_mask):
+    '''
+    Breadth first search outwards from every goal square at once, one whole layer per step.
+
+    Args:
+        grid: a grid object (must provide get_open_masks)
+        goal_mask: the player's goal squares as a square bit mask
+
+    Returns:
+        DistanceField
+    '''
+    open_masks = grid.get_open_masks()
+    dist = bytearray(b"\xff" * 81)
+    layers = []
+    reach = frontier = goal_mask
+    while frontier:
+        write_mask(dist, frontier, len(layers))
+        layers.append(frontier)
+        frontier = spread(frontier, open_masks) & ~reach
+        reach |= frontier
+    return DistanceField(bytes(dist), tuple(layers))
+
+
+def update_field(grid, field, placement):
+    '''
+    Repairs a field after placement (a placement code) has been added to grid.
+    Squares that lost every neighbour one step closer to the goal are found layer by layer and only they
+    get new distances, grown outwards from the unchanged squares around them.
+
+    Returns:
+        the new DistanceField (the same object if no distance changed)
+    '''
+    dist = field.dist
+    seeds = []
+    for a, b in CUT_EDGES[placement]:
+        da, db = dist[a], dist[b]
+        if da == db + 1:
+            seeds.append(da)
+        elif db == da + 1:
+            seeds.append(db)
+    if not seeds:
+        return field
+
+    open_masks = grid.get_open_masks()
+    layers = field.layers
+    first, last = min(seeds), max(seeds)
+    raised = 0
+    for k in range(first, len(layers)):
+        supported = spread(layers[k - 1] & ~raised, open_masks)
+        lost = layers[k] & ~supported
+        if not lost and k >= last:
+            break
+        raised |= lost
+    if not raised:
+        return field
+
+    new_layers = list(layers[:first])
+    remaining = raised
+    k = first
+    while True:
+        kept = layers[k] & ~raised if k < len(layers) else 0
+        added = remaining & spread(new_layers[k - 1], open_masks)
+        if not kept | added:
+            break
+        remaining ^= added
+        new_layers.append(kept | added)
+        k += 1
+
+    new_dist = bytearray(dist)
+    for k in range(first, len(new_layers)):
+        write_mask(new_dist, new_layers[k] & raised, k)
+    write_mask(new_dist, remaining, UNREACHABLE)
+    return DistanceField(bytes(new_dist), tuple(new_layers))
+
+
+def next_square(grid, field, s):
+    '''returns the first neighbour (N, E, S, W order) of square s that is one step closer to the goal, or None'''
+    dist = field.dist
+    d = dist[s]
+    if d == 0 or d == UNREACHABLE:
+        return None
+    for w in grid.get_neighbor_indices(s):
+        if dist[w] == d - 1:
+            return w
+    return None
+
+
+def descend(grid, field, s):
+    '''
+    Follows the field downhill from square s.
+
+    Returns:
+        list of square indices from s to a goal square, or None if s is cut off
+    '''
+    dist = field.dist
+    d = dist[s]
+    if d == UNREACHABLE:
+        return None
+    path = [s]
+    while d:
+        d -= 1
+        for w in grid.get_neighbor_indices(s):
+            if dist[w] == d:
+                s = w
+                break
+        path.append(s)
+    return path
+
+
+def lengthening_placements(grid, field, s):
+    '''
+    Finds every placement that would make the shortest route from square s longer,
+    i.e. the placements that cut all shortest routes (physical legality is not checked).
+
+    Returns:
+        set of placement codes
+    '''
+    dist = field.dist
+    d = dist[s]
+    if d == 0 or d == UNREACHABLE:
+        return set()
+
+    #downhill edges of the shortest route graph, layer by layer
+    edges = []
+    layer = {s}
+    while layer and dist[next(iter(layer))] > 0:
+        next_layer = set()
+        for u in layer:
+            du = dist[u]
+            for w in grid.get_neighbor_indices(u):
+                if dist[w] == du - 1:
+                    edges.append((u, w))
+                    next_layer.add(w)
+        layer = next_layer
+
+    successors = {}
+    for u, w in edges:
+        successors.setdefault(u, []).append(w)
+
+    candidates = set()
+    for u, w in edges:
+        candidates.update(edge_placements(u, w))
+
+    lengthening = set()
+    for placement in candidates:
+        cut = set()
+        for a, b in CUT_EDGES[placement]:
+            cut.add((a, b))
+            cut.add((b, a))
+        layer = {s}
+        while layer and dist[next(iter(layer))] > 0:
+            layer = {w for u in layer for w in successors.get(u, ()) if (u, w) not in cut}
+        if not layer:
+            lengthening.add(placement)
+    return lengthening
+
+
+def edge_placements(a, b):
+    '''returns the codes of the (in range) placements that cut the edge between squares a and b'''
+    if a > b:
+        a, b = b, a
+    ax, ay = a % 9, a // 9
+    if b - a == 9:
+        options = ((ax, ay, 0), (ax - 1, ay, 0))
+    else:
+        options = ((ax, ay - 1, 1), (ax, ay, 1))
+    return [placement_code(x, y, r) for x, y, r in options if 0 <= x < 8 and 0 <= y < 8]
+
+
+# a*81 + b -> placement codes cutting the edge between adjacent squares a and b (None if not adjacent), and the same as a placement mask
+EDGE_BLOCKERS = [None] * (81 * 81)
+for _a in range(81):
+    for _b in (_a + 1, _a + 9):
+        if _b < 81 and (_b - _a == 9 or _a % 9 < 8):
+            EDGE_BLOCKERS[_a * 81 + _b] = EDGE_BLOCKERS[_b * 81 + _a] = tuple(edge_placements(_a, _b))
+EDGE_MASKS = [None if codes is None else sum(1 << c for c in codes) for codes in EDGE_BLOCKERS]
@@ -0,0 +1,223 @@
+'''
+Exact solver for two player positions with no walls left.
+
+Once both players are out of walls the board can no longer change and the game is a pawn race where the pawns can
+still meet (jumps and blocked steps). A position is then just (player to move, pawn 0 square, pawn 1 square), so for
+a wall layout there are 2 * 81 * 81 positions, few enough to solve all of them at once by retrograde analysis:
+
+    positions where the last mover reached their goal are lost for the player to move (0 plies to the end)
+    a position is won in k plies if a move leads to a position lost in k - 1,
+    and lost in k plies if every move leads to a position won by the opponent, the slowest in k - 1
+
+Each round of this runs over the whole successor table in NumPy. What is left undecided after the last round can be
+played forever by both sides without losing: a draw. Players without a legal move pass, like Gamestate.skip_turn.
+
+Tables are kept per wall layout in an LRU cache. The layout's key is the Calcstate hash with the pawn, turn and walls
+left keys taken back out, so finding the table of a position costs a few xors and the answer a few array reads.
+'''
+
+from collections import OrderedDict
+import threading
+import numpy as np
+from calcstate import Z_POS, Z_TURN, Z_WALLS
+from move_tables import STEPS, JUMPS
+from moves import PAWN_BASE, move_destination
+from bitgrid import GOAL_MASKS
+
+WIN, DRAW, LOSS = 1, 0, -1
+# most moves a pawn can have: 3 steps and 2 sidestep jumps past a pawn on the fourth side
+MAX_MOVES = 5
+PASS = -2
+ON_GOAL = np.array([[GOAL_MASKS[p] >> s & 1 for s in range(81)] for p in range(2)], dtype=bool)
+
+
+class EndgameTable:
+    '''
+    The solution of one wall layout, indexed [player to move, pawn 0 square, pawn 1 square]:
+        value   WIN, DRAW or LOSS for the player to move
+        plies   plies to the end of the game with best play (the winner hurries, the loser holds out), 0 for draws
+    moves[s, o] and landings[s, o] are the move codes and landing squares of a pawn on s with the other pawn on o,
+    padded with -1 (a single PASS landing if it has no move).
+    '''
+    def __init__(self, grid):
+        self.moves, self.landings = pawn_moves(grid)
+        self.value, self.plies = solve(self.landings)
+
+    def get_result(self, player_up, positions):
+        #(value, plies) for the player to move
+        i = (player_up, positions[0], positions[1])
+        return int(self.value[i]), int(self.plies[i])
+
+    def get_best_move(self, player_up, positions):
+        '''
+        Returns:
+            (move code or None if the player to move has to pass, value, plies) of the best move: the fastest win,
+            else a draw, else the slowest loss
+        '''
+        p0, p1 = positions
+        s, o = (p0, p1) if player_up == 0 else (p1, p0)
+        value, plies = self.get_result(player_up, positions)
+        best, best_score = None, None
+        for move, landing in zip(self.moves[s, o], self.landings[s, o]):
+            if landing < 0:
+                break
+            child = (1 - player_up, landing, p1) if player_up == 0 else (1 - player_up, p0, landing)
+            child_value, child_plies = int(self.value[child]), int(self.plies[child])
+            # ordered by our result, then by how fast we win or how long we hold out
+            score = (-child_value, child_plies if child_value == WIN else -child_plies)
+            if best_score is None or score > best_score:
+                best, best_score = int(move), score
+        return best, value, plies
+
+
+def pawn_moves(grid):
+    '''
+    Pawn moves of every (own square, other pawn's square) pair with grid's walls, following move_tables.py
+
+    Returns:
+        moves, landings: (81, 81, MAX_MOVES) int arrays of move codes and landing squares, -1 padded
+    '''
+    bits = [grid.get_wall_bits(s) for s in range(81)]
+    moves = np.full((81, 81, MAX_MOVES), -1, dtype=np.int16)
+    landings = np.full((81, 81, MAX_MOVES), -1, dtype=np.int16)
+    for s in range(81):
+        steps = STEPS[s][bits[s]]
+        # away from the other pawn the moves are the steps whatever square it is on
+        codes = [PAWN_BASE + n for _, n in steps]
+        moves[s, :, :len(codes)] = codes
+        landings[s, :, :len(codes)] = [n for _, n in steps]
+        for d, o in steps:
+            codes = []
+            for _, n in steps:
+                if n != o:
+                    codes.append(PAWN_BASE + n)
+                else:
+                    codes.extend(JUMPS[o][bits[o]][d])
+            moves[s, o] = -1
+            landings[s, o] = -1
+            moves[s, o, :len(codes)] = codes
+            landings[s, o, :len(codes)] = [move_destination(code) for code in codes]
+            if not codes:
+                landings[s, o, 0] = PASS
+    return moves, landings
+
+
+def solve(landings):
+    '''
+    Retrograde analysis of all positions of one wall layout (see the module docstring)
+
+    Returns:
+        value, plies: (2, 81, 81) int8 and int16 arrays
+    '''
+    # successors[i, t, p0, p1] is the i-th successor as a flat index into the (2, 81, 81) position arrays. The padding
+    # points at an extra position that counts as won by the opponent, so it never makes a move look winning or stops
+    # a loss, and a position's result is read off of the smallest value among its successors
+    t, p0, p1 = np.indices((2, 81, 81))
+    own = np.where(t == 0, p0, p1)
+    other = np.where(t == 0, p1, p0)
+    landing = np.moveaxis(landings[own, other], -1, 0).astype(np.intp)
+    landing = np.where(landing == PASS, own, landing)
+    child_p0 = np.where(t == 0, landing, p0)
+    child_p1 = np.where(t == 0, p1, landing)
+    padding = 2 * 81 * 81
+    successors = np.where(landing < 0, padding, ((1 - t) * 81 + child_p0) * 81 + child_p1)
+    # row major, so the gather below comes out with each successor row contiguous for the reduction
+    successors = np.ascontiguousarray(successors.reshape(MAX_MOVES, -1))
+
+    value = np.zeros(padding + 1, dtype=np.int8)
+    plies = np.zeros(padding, dtype=np.int16)
+    value[padding] = WIN
+    # the last mover reached their goal, and positions with both pawns on one square never come up
+    decided = (ON_GOAL[1 - t, other] | (p0 == p1)).ravel()
+    value[:padding][decided] = LOSS
+
+    k = 0
+    while True:
+        k += 1
+        best = np.minimum.reduce(value[successors], axis=0)
+        wins = (best == LOSS) & ~decided
+        losses = (best == WIN) & ~decided
+        settled = wins | losses
+        if not settled.any():
+            break
+        value[:padding][wins] = WIN
+        value[:padding][losses] = LOSS
+        plies[settled] = k
+        decided |= settled
+    return value[:padding].reshape(2, 81, 81), plies.reshape(2, 81, 81)
+
+
+class EndgameSolver:
+    '''
+    Solves wall exhausted two player positions, keeping the tables of the last cap_layouts wall layouts.
+    get_move and get_result take a Calcstate and return None for positions it does not cover.
+    The cache is locked, so search threads can share one solver (a layout two threads need is solved once).
+    '''
+    def __init__(self, cap_layouts = 128):
+        self.cap_layouts = cap_layouts
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.solved = 0
+
+    @staticmethod
+    def covers(calcstate):
+        return calcstate.player_count == 2 and calcstate.wall_count == 0 and not calcstate.over
+
+    def get_key(self, calcstate):
+        #hash of calcstate's wall layout: its Calcstate hash without the pawn, turn and walls left keys
+        positions = self.get_positions(calcstate)
+        key = calcstate.get_hash() ^ Z_TURN[calcstate.player_up] ^ Z_WALLS[0][0] ^ Z_WALLS[1][0]
+        return key ^ Z_POS[0][positions[0]] ^ Z_POS[1][positions[1]]
+
+    def has_table(self, calcstate):
+        key = self.get_key(calcstate)
+        with self.lock:
+            return key in self.tables
+
+    def get_table(self, calcstate):
+        #the table of calcstate's wall layout, solved on first use
+        key = self.get_key(calcstate)
+        with self.lock:
+            table = self.tables.get(key)
+            if table is None:
+                table = self.tables[key] = EndgameTable(calcstate.grid)
+                self.solved += 1
+                if len(self.tables) > self.cap_layouts:
+                    self.tables.popitem(last=False)
+            else:
+                self.tables.move_to_end(key)
+                self.hits += 1
+        return table
+
+    def get_positions(self, calcstate):
+        return tuple(9 * y + x for x, y in calcstate.player_positions)
+
+    def get_result(self, calcstate):
+        '''
+        Returns:
+            (WIN / DRAW / LOSS for the player to move, plies to the end), or None if the position is not covered
+        '''
+        if not self.covers(calcstate):
+            return None
+        return self.get_table(calcstate).get_result(calcstate.player_up, self.get_positions(calcstate))
+
+    def get_move(self, calcstate):
+        '''
+        Returns:
+            (best move, value, plies) for the player to move (see EndgameTable.get_best_move), or None if not covered
+        '''
+        if not self.covers(calcstate):
+            return None
+        return self.get_table(calcstate).get_best_move(calcstate.player_up, self.get_positions(calcstate))
+
+    def get_win_probability(self, calcstate, player):
+        #1, 0.5 or 0 for player, None if the position is not covered
+        result = self.get_result(calcstate)
+        if result is None:
+            return None
+        value = result[0] if calcstate.player_up == player else -result[0]
+        return (value + 1) / 2
+
+    def get_stats(self):
+        return {"layouts": len(self.tables), "solved": self.solved, "hits": self.hits}
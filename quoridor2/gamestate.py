@@ -1,4 +1,8 @@
 from grid import SquareGrid
+from bitgrid import BitboardGrid, GOAL_MASKS, COORDS
+from move_tables import STEPS, STEP_CODES, JUMPS
+from moves import *
+from distance_field import build_field, update_field, descend, next_square, lengthening_placements, EDGE_MASKS
 import numpy as np
 from utils import *
 from random import choice, random, seed, randint
@@ -6,17 +10,41 @@ from union_find import *
 import cProfile
 import pstats
 from copy import deepcopy
+import os
+
+# grid implementations by backend name, QUORIDOR_GRID picks the default one. The numba backend is only imported
+# (which loads numba and compiles its kernels) the first time get_grid_class is asked for it.
+GRID_BACKENDS = {"bitboard": BitboardGrid, "array": SquareGrid}
+BACKEND_NAMES = ("bitboard", "array", "numba")
+
+
+def get_grid_class(backend):
+    if backend == "numba" and backend not in GRID_BACKENDS:
+        from compiled_grid import CompiledGrid
+        GRID_BACKENDS["numba"] = CompiledGrid
+    return GRID_BACKENDS[backend]
 
 
 class Gamestate:
+
+    grid_class = get_grid_class(os.environ.get("QUORIDOR_GRID", "bitboard"))
+
+    __slots__ = ("over", "winner", "player_up", "player_count", "player_positions", "player_walls", "wall_count",
+                 "grid", "open_mask", "goals", "goal_masks", "dists", "paths", "blockers", "blockers_twice", "overlap_mask",
+                 "_shared")
     
     ###############################  Overview  ##################################
     '''
     This class stores a Quoridor game position and some additional data and is written to be flexible so it can be used in a variety of simulations and in the base game
 
     Important Variables:
-        self.grid: a SquareGrid object containing a 9x9 numpy array storing the walls, occupation, and adjacencies of each square in the position.
-        self.open_placements: a set of all legal wall placement tuples for the current position (gets updated as game progresses but avoids re-evaluation)
+        self.grid: a grid object storing the walls, occupation, and adjacencies of each square in the position.
+                   grid_class picks the implementation: BitboardGrid (bit masks, the default), SquareGrid (a 9x9 numpy array)
+                   or CompiledGrid (the numpy array with numba kernels for its searches, see compiled_grid.py)
+        self.open_mask: a 128 bit mask of all legal wall placement codes for the current position, bit c set if placement c is open
+                        (gets updated as game progresses but avoids re-evaluation). self.open_placements gives the same as a set.
+
+        Moves are integer codes (see moves.py): 0-127 are wall placements, higher codes are pawn steps and jumps.
 
         self.player_up: an int indicating which player is "at bat"
         self.over: indicates whether the game has reached an end state
@@ -26,23 +54,34 @@ class Gamestate:
             self.player_positions: a list of tuples, each of which has an x and a y coordinate
             self.player_walls: a list of ints tracking how many walls each player has remaining to them
             self.goals: a list of sets of coordinates which are the goals for each respective player
-            self.paths: a list of lists of coordinates. Each sublist is the shortest path from the player's coordinates to a goal square
-            self.blockers: a list of sets of placement tuples. Placments in player i's set intersect player i's path.
+            self.goal_masks: a tuple of the same goals as square bit masks (bit 9*y + x), used for reachability floods
+            self.dists: a list of goal DistanceFields (see distance_field.py), updated incrementally as walls are added
+            self.paths: a list of bytes of square indices (9*y + x). Each is the shortest path from the player's square to a goal square
+            self.blockers: a list of placement masks. Placments in player i's mask intersect player i's path.
+            self.blockers_twice: a list of placement masks of the blockers that cut two edges of the path. Together with
+                                 blockers this is a reference count (0, 1 or 2) per placement, so pawn steps can drop
+                                 the blockers of the edge left behind without rescanning the path.
+        self.overlap_mask: every player's blockers or'ed together
+
+        Clones share the grid and the lists above with the gamestate they came from (copy on write, see get_clone).
+        Elements of the lists (position tuples, path bytes, DistanceFields, blocker masks) are immutable.
     '''
 
 
     ##########################  Instance Initiations  ###########################
 
-    def set_up_as_start(self, player_count, total_walls = 20):
+    def set_up_as_start(self, player_count, total_walls = 20, backend = None):
         '''
         Sets up a gamestate to standard starting position.   
 
         Args:
             player_count: the number of players playing the game
             total_walls:  the number of walls to be evenly distributed to the players
+            backend: name of the grid implementation (see BACKEND_NAMES), defaults to grid_class
         '''
 
         #win flag and identifier
+        self._shared = False
         self.over = False
         self.winner = None 
 
@@ -56,26 +95,75 @@ class Gamestate:
         self.wall_count = sum(self.player_walls)
 
         ###### set up grid  #######
-        self.grid = SquareGrid()  
+        self.grid = (self.grid_class if backend is None else get_grid_class(backend))()
         self.grid.set_up_from_start()
 
         for player_position in self.player_positions:  
             self.grid.add_pawn(player_position)  
 
-        #  Set of all legal wall placements (updated over time)
-        self.open_placements = self.get_start_placements()  
+        #  Mask of all legal wall placements (updated over time)
+        self.open_mask = self.get_start_placements()  
         
-        # List of Sets of goal coordinates for each player
+        # List of Sets of goal coordinates for each player (and the same goals as square bit masks)
         self.goals = self.get_starting_goals()  
+        self.goal_masks = GOAL_MASKS[:player_count]
+
+        self.set_up_paths()
+
+    def set_up_paths(self):
+        #  Distance to goal from every square for each player, and the shortest path read off of it as square indices
+        self.dists = [build_field(self.grid, self.goal_masks[i]) for i in range(self.player_count)]
+        self.paths = [self.get_field_path(i) for i in range(self.player_count)]  
+        self.blockers = [0] * self.player_count
+        self.blockers_twice = [0] * self.player_count
+        for i in range(self.player_count):
+            self.set_blockers(i, self.paths[i])
+        self.update_overlaps()
+
+    def serialize(self):
+        '''
+        Compact picklable form of the position (for sending to other processes): a tuple of ints, the grid snapshot
+        and the name of the grid backend the snapshot is for.
+        The goal fields, paths and blockers are not included, load_serialized rebuilds them.
+        '''
+        return (self.player_count, self.player_up, self.over, self.winner,
+                tuple(9 * y + x for x, y in self.player_positions), tuple(self.player_walls), self.open_mask,
+                self.grid.snapshot(), self.get_backend())
 
-        #  Shortest path from each player to a goal coord as list of coord tuples
-        self.paths = [self.grid.astar_full_path(self.player_positions[i], self.goals[i]) for i in range(self.player_count)]  
-        self.blockers = [self.get_blockers(self.paths[i]) for i in range(self.player_count)]
+    def get_backend(self):
+        #name of the grid implementation in GRID_BACKENDS
+        return next(name for name, grid_class in GRID_BACKENDS.items() if type(self.grid) is grid_class)
 
-    def get_clone(self):
+    def load_serialized(self, data):
+        '''
+        Sets up a gamestate from the output of serialize, on the grid backend it was serialized from
+
+        Args:
+            data: tuple returned by serialize
+        '''
+        (self.player_count, self.player_up, self.over, self.winner,
+         squares, player_walls, self.open_mask, grid_snapshot, backend) = data
+        self._shared = False
+        self.player_positions = [COORDS[s] for s in squares]
+        self.player_walls = list(player_walls)
+        self.wall_count = sum(player_walls)
+        self.grid = get_grid_class(backend)()
+        self.grid.set_up_from_start()
+        self.grid.restore(grid_snapshot)
+        self.goals = self.get_starting_goals()
+        self.goal_masks = GOAL_MASKS[:self.player_count]
+        self.set_up_paths()
+
+    def get_clone(self, private = False):
         '''
         Creates a clone of this gamestate with all attributes matching (to be used in game tree traversal)
-        Faster than deepcopy because some data can be shallow
+        The clone shares the grid and the per player lists with self. Both are flagged as shared and whichever
+        of the two plays a move first takes its own copies (_unshare), so clones that are never played cost
+        a single object.
+
+        Args:
+            private: the clone takes its own copies right away and self is not flagged. For clones that are played
+                at once (rollouts), so the state they were taken from keeps playing moves without copying
 
         Returns:
             Gamestate object that matches self 
@@ -84,32 +172,56 @@ class Gamestate:
         clone.player_count = self.player_count
         clone.over = self.over
         clone.player_up = self.player_up
-        clone.player_positions = self.player_positions[:]
-        clone.player_walls = self.player_walls[:]
-        clone.grid = self.grid.get_clone()
-        clone.open_placements = self.open_placements.copy()
-        clone.goals = self.goals[:]
+        clone.player_positions = self.player_positions
+        clone.player_walls = self.player_walls
+        clone.grid = self.grid
+        clone.open_mask = self.open_mask
+        clone.goals = self.goals
+        clone.goal_masks = self.goal_masks
         clone.wall_count = self.wall_count
-        clone.paths = [path[:] for path in self.paths]
-        clone.blockers = [b.copy() for b in self.blockers]
+        clone.dists = self.dists
+        clone.paths = self.paths
+        clone.blockers = self.blockers
+        clone.blockers_twice = self.blockers_twice
+        clone.overlap_mask = self.overlap_mask
         clone.winner = self.winner
+        clone._shared = True
+        if private:
+            clone._unshare()
+        else:
+            self._shared = True
         return clone
+
+    def _unshare(self):
+        #copy on write: takes private copies of everything play_move writes to (the list elements are immutable)
+        self.player_positions = self.player_positions[:]
+        self.player_walls = self.player_walls[:]
+        self.dists = self.dists[:]
+        self.paths = self.paths[:]
+        self.blockers = self.blockers[:]
+        self.blockers_twice = self.blockers_twice[:]
+        self.grid = self.grid.get_clone()
+        self._shared = False
     
     
     ############################  Move Execution  ############################
 
     def play_move(self, move):
         '''
-        Takes in a move tuple and executes move on gamestate.
+        Takes in a move code and executes move on gamestate.
 
         Args:
-            Move - Can take the following forms: 
+            Move - a move code (see moves.py). The tuple forms are still accepted and encoded first:
                 (x, y, r)            | A wall placement centered at the north-east corner of the square at x, y. Horizontal if r == 0 and Vertical if r == 1
                 (x, y)               | Indicates a pawn move from the current square to the square at x, y.
                 ((x1, y1),(x2, y2))  | Indicates a pawn move that involves a jump over another pawn. Ends at x2, y2. 
         '''
+        if type(move) != int:
+            move = encode_move(move)
 
-        if self.move_is_placement(move):
+        if self._shared:
+            self._unshare()
+        if move < PAWN_BASE:
             self.play_wall(move)
         else:
             self.play_pawn(move)
@@ -124,14 +236,14 @@ class Gamestate:
         Plays wall on gamestate and updates relevant metadata
         
         Args:
-            Move: A tuple of the form (x, y, r)            
+            Move: A placement code            
         '''
 
-        if move not in self.open_placements:
-            raise Exception(f"Illegal placement {move} requested:\n{self}")
+        if not self.open_mask >> move & 1:
+            raise Exception(f"Illegal placement {decode_move(move)} requested:\n{self}")
         
         #add wall
-        self.grid.add_wall(move)
+        self.grid.add_wall(PLACEMENTS[move])
 
         #update remaining wall info
         self.player_walls[self.player_up] -= 1
@@ -140,12 +252,12 @@ class Gamestate:
         #update shortest path 
         self.update_paths_after_placement(move)
 
-        # if no more walls, empty open_placements
+        # if no more walls, empty open_mask
         if self.wall_count == 0 :
-            self.open_placements = set()
+            self.open_mask = 0
             return 
         
-        #remove unplayable moves from open_placements
+        #remove unplayable moves from open_mask
         self.remove_physicals(move)
         self.remove_illegals(move)
 
@@ -154,86 +266,165 @@ class Gamestate:
         Plays a pawn move and updates relevant metadata
 
         Args:
-            move: a pawn move tuple (either a pair of coords, or a two pairs of coord tuples)
+            move: a pawn step or jump code
         '''
         if move not in self.get_legal_pawn_moves():
-            raise Exception(f"Illegal pawn move {move} requested:\n{self}")
+            raise Exception(f"Illegal pawn move {decode_move(move)} requested:\n{self}")
         
-        start_coords = self.player_positions[self.player_up]
-        move_components = [start_coords, move] if type(move[0]) == int else [start_coords] + list(move)
-        self.grid.remove_pawn(move_components[0])
-        self.grid.add_pawn(move_components[-1])
-        self.player_positions[self.player_up] = move_components[-1]
+        x, y = self.player_positions[self.player_up]
+        destination = move_destination(move)
+        move_components = [9 * y + x, destination] if move < JUMP_BASE else [9 * y + x, jump_over(move), destination]
+        self.grid.remove_pawn((x, y))
+        self.grid.add_pawn(COORDS[destination])
+        self.player_positions[self.player_up] = COORDS[destination]
         self.update_paths_after_pawn(move)
         if self.wall_count > 0:
             self.update_illegals(self.get_blockers(move_components))
 
     def skip_turn(self):
         # in some 3 and 4 player games one can encounter a position with no legal moves (very rare)
+        record = self.get_undo_record()
         self.update_player()
+        return record
+
+    ############################### Make / Unmake ##################################
+
+    '''A search can walk one gamestate down the tree and back up instead of cloning at every node:
+    make_move plays a move and returns an undo record, undo_move puts the position back exactly as it was.
+    Records have to be undone in reverse order of play. play_move keeps no record, so rollouts and clone
+    based searches do not pay for one.'''
+
+    def make_move(self, move):
+        '''
+        play_move that also returns an undo record, pass it to undo_move to take the move back
+        '''
+        record = self.get_undo_record()
+        self.play_move(move)
+        return record
+
+    def get_undo_record(self):
+        '''
+        Captures everything a move can change. The lists are shallow copied: their elements (position tuples,
+        path bytes, DistanceFields and blocker masks) are immutable.
+        '''
+        return (self.player_up, self.over, self.winner, self.player_positions[:], self.player_walls[:],
+                self.wall_count, self.open_mask, self.dists[:], self.paths[:], self.blockers[:],
+                self.blockers_twice[:], self.overlap_mask, self.grid.snapshot())
+
+    def undo_move(self, record):
+        '''
+        Restores the position from before the move that returned record (including flags set after it, e.g. by early evaluation)
+
+        Args:
+            record: the undo record returned by make_move or skip_turn
+        '''
+        (self.player_up, self.over, self.winner, self.player_positions, self.player_walls,
+         self.wall_count, self.open_mask, self.dists, self.paths, self.blockers,
+         self.blockers_twice, self.overlap_mask, grid_snapshot) = record
+        #the lists in a record are private copies, only the grid can still be shared
+        if self._shared:
+            self.grid = self.grid.get_clone()
+            self._shared = False
+        self.grid.restore(grid_snapshot)
 
     ############################### Path Caching ##################################
 
     '''The gamestate stores the current shortest path and the placements that intersect it. 
     This has value in narrowing illegal move candidates and making good moves in rollout.'''
 
+    def get_field_path(self, player):
+        #reads a shortest path for a player off of their distance field
+        x, y = self.player_positions[player]
+        squares = descend(self.grid, self.dists[player], 9 * y + x)
+        if squares is None:
+            return None
+        return bytes(squares)
+
     def update_path(self, player):
         #sets the path for a player to the shortest currently available path
-        self.paths[player] = self.grid.astar_full_path(self.player_positions[player], self.goals[player])
+        self.paths[player] = self.get_field_path(player)
 
     def update_paths_after_placement(self, move):
-        #updates the path after a placement is played, only updating the path for those player's whose existing path is blocked by the placement. 
+        #repairs every distance field, then updates the path for those player's whose existing path is blocked by the placement. 
         for i in range(self.player_count):
-            blockers = self.blockers[i]
-            if move in blockers:
+            self.dists[i] = update_field(self.grid, self.dists[i], move)
+            if self.blockers[i] >> move & 1:
                 self.update_path(i)               
-                self.blockers[i] = self.get_blockers(self.paths[i])
+                self.set_blockers(i, self.paths[i])
+        self.update_overlaps()
     
     def update_paths_after_pawn(self, move):
         #updates the current player's path after their pawn is moved. 
 
-        if self.paths[self.player_up][1] == self.player_positions[self.player_up]:
-            path = self.paths[self.player_up][1:]
-            # path1 = self.grid.astar_full_path(self.player_positions[self.player_up], self.goals[self.player_up])
-            # if path != path1:
-            #     print(path,"\n", path1)
-
-            self.paths[self.player_up] = path
-            #ToDo, possibly change how blockers work: storing them in dict with number of uses so that blockers can be removed
-            #rather than completely re-evaluating the set.
-            self.blockers[self.player_up] = self.get_blockers(path)
+        p = self.player_up
+        x, y = self.player_positions[p]
+        old_path = self.paths[p]
+        if old_path[1] == 9 * y + x:
+            self.paths[p] = old_path[1:]
+            #only the edge left behind drops out, its placements lose one reference
+            dropped = EDGE_MASKS[old_path[0] * 81 + old_path[1]]
+            twice = self.blockers_twice[p]
+            self.blockers[p] &= ~(dropped & ~twice)
+            self.blockers_twice[p] = twice & ~dropped
         else:
-            path = self.grid.astar_full_path(self.player_positions[self.player_up], self.goals[self.player_up])
-            self.paths[self.player_up] = path
-            self.blockers[self.player_up] = self.get_blockers(path)
+            self.paths[p] = self.get_field_path(p)
+            self.set_blockers(p, self.paths[p])
+        self.update_overlaps()
+
+    ############################### Distance Lookups ##################################
+
+    def path_length(self, player):
+        #number of steps from a player's pawn to their goal (pawns ignored)
+        x, y = self.player_positions[player]
+        return self.dists[player].dist[9 * y + x]
+
+    def next_step(self, player):
+        #a square one step further along a shortest path, or None if the player is on their goal
+        x, y = self.player_positions[player]
+        s = next_square(self.grid, self.dists[player], 9 * y + x)
+        return None if s is None else COORDS[s]
+
+    def get_lengthening_placements(self, player):
+        '''
+        Gets the placements that would make a player's shortest path longer (legality not checked).
+
+        Returns:
+            Set of placement codes
+        '''
+        x, y = self.player_positions[player]
+        return lengthening_placements(self.grid, self.dists[player], 9 * y + x)
 
     def get_blockers(self, path):
         '''
-        gets a set of placements that impede path (including impossible placements)
+        gets the placements that impede path (including impossible placements)
 
         Args:
-            path: List of coord tuples
+            path: sequence of square indices (9*y + x), e.g. an entry of self.paths
 
         Returns:
-            blockers: Set of placement tuples 
+            blockers: placement mask 
         '''
-        blockers = set()
+        blockers = 0
         for j in range(len(path)-1):
-            a = path[j]
-            b = path[j+1]
-            if a > b:
-                a, b = b, a
-            ax, ay = a
-            bx, by = b
-            if ax == bx:
-                for placement in ((ax, ay, 0), (ax-1, ay, 0)):
-                    blockers.add(placement)
-            if ay == by:
-                for placement in ((ax, ay-1, 1), (ax, ay, 1)):
-                    blockers.add(placement)
-
+            blockers |= EDGE_MASKS[path[j] * 81 + path[j+1]]
         return blockers
 
+    def set_blockers(self, player, path):
+        #counts the blockers of a whole path: a placement seen on a second edge moves into blockers_twice
+        once = twice = 0
+        for j in range(len(path)-1):
+            edge = EDGE_MASKS[path[j] * 81 + path[j+1]]
+            twice |= edge & once
+            once |= edge
+        self.blockers[player] = once
+        self.blockers_twice[player] = twice
+
+    def update_overlaps(self):
+        overlaps = 0
+        for blockers in self.blockers:
+            overlaps |= blockers
+        self.overlap_mask = overlaps
+
     ############################  Legal move queries  ##############################
 
     def get_legal_moves(self):
@@ -245,71 +436,70 @@ class Gamestate:
     
     def get_legal_pawn_moves(self):
         '''
-        Determines legal pawn moves for player_up
+        Determines legal pawn moves for player_up from the static tables in move_tables.py
 
         Returns:
-            options: A list of move tuples
+            options: A list of move codes
         '''
-        start = self.player_positions[self.player_up]
-        options = []
-        neighbors = self.grid.get_neighbors(start)
+        x, y = self.player_positions[self.player_up]
+        s = 9 * y + x
+        grid = self.grid
+        bits = grid.get_wall_bits(s)
+        if not grid.has_adjacent_pawn(s):
+            return list(STEP_CODES[s][bits])
 
-        for neighbor in neighbors:
+        options = []
+        for d, neighbor in STEPS[s][bits]:
             # jumping moves
-            if self.grid.is_occupied(neighbor):
-                one_beyond = (2 * neighbor[0] - start[0], 2 * neighbor[1] - start[1])
-
-                n2s = self.grid.get_neighbors(neighbor)
-                n2s.remove(start)
-                if one_beyond in n2s:
-                    options.append((neighbor,one_beyond))
-                    continue
-                for n in n2s:
-                    options.append((neighbor,n))
+            if grid.is_occupied_index(neighbor):
+                options.extend(JUMPS[neighbor][grid.get_wall_bits(neighbor)][d])
             else:
-                options.append(neighbor)
+                options.append(PAWN_BASE + neighbor)
         return options
         
     def get_legal_placements(self):
         #returns a list of legal wall placements
         if self.player_walls[self.player_up] > 0:
-            return list(self.open_placements)
+            return mask_codes(self.open_mask)
         return []
+
+    def is_legal_move(self, move):
+        #checks a single move code without listing every legal move
+        if move < PAWN_BASE:
+            return self.player_walls[self.player_up] > 0 and bool(self.open_mask >> move & 1)
+        return move in self.get_legal_pawn_moves()
+
+    def get_placement_count(self):
+        #number of legal wall placements for player_up, without listing them
+        if self.player_walls[self.player_up] > 0:
+            return self.open_mask.bit_count()
+        return 0
+
+    @property
+    def open_placements(self):
+        '''set of the open placement codes, read off of open_mask (for callers that want a set)'''
+        return set(mask_codes(self.open_mask))
     
     ################## Remove Placements from Open Placements  ################=
 
     def remove_physicals(self, placement):
         '''
-        Removes placements that intersect with the played move from open_placements
+        Removes placements that intersect with the played move from open_mask
         Only called after a placement is played
         
         Args:
             move:  The placement that was just played
         '''
-        x, y, r = placement
-        if r == 0:
-            for dx in (-1, 0, 1):
-                nx = x + dx
-                if 0 <= nx < 8:
-                    self.open_placements.discard((nx, y, r))
-                    self.grid.unmark_illegal((nx, y, r))
-        else:
-            for dy in (-1, 0, 1):
-                ny = y + dy
-                if 0 <= ny < 8:
-                    self.open_placements.discard((x, ny, r))
-                    self.grid.unmark_illegal((x, ny, r))
-    
-        if 0 <= x < 8 and 0 <= y < 8:
-            self.open_placements.discard((x, y, 1 - r))
-            self.grid.unmark_illegal((x, y, 1 - r))
+        self.open_mask &= ~CONFLICT_MASKS[placement]
+        for conflict in PHYSICAL_CONFLICTS[placement]:
+            self.grid.unmark_illegal(PLACEMENTS[conflict])
 
     def remove_illegals(self, placement):
         '''
-        removes all moves made illegal by placement from open_placements
+        removes all moves made illegal by placement from open_mask
 
         Args:
-            Placement: Placment tuple
+            Placement: Placment code
         '''
         candidates = self.narrow_candidates(placement)
         length = len(candidates)
@@ -323,15 +513,15 @@ class Gamestate:
 
     def update_illegals(self, candidates):
         '''
-        Handles additions to illegal set from set of candidates'''
+        Handles additions to illegal set from a placement mask of candidates'''
         marked_illegal = []
         marked_legal = []
 
         # One loop: classify candidates
-        for candidate in candidates:
-            if self.grid.is_illegal(candidate):
+        for candidate in mask_codes(candidates):
+            if self.grid.is_illegal(PLACEMENTS[candidate]):
                 marked_illegal.append(candidate)
-            elif candidate in self.open_placements:
+            elif self.open_mask >> candidate & 1:
                 marked_legal.append(candidate)
 
         # Get all new illegal statuses in one go, if you can
@@ -341,8 +531,8 @@ class Gamestate:
 
         for c in marked_illegal:
             if c not in new_illegals_set:
-                self.grid.unmark_illegal(c)
-                self.open_placements.add(c)
+                self.grid.unmark_illegal(PLACEMENTS[c])
+                self.open_mask |= 1 << c
 
         for c in marked_legal:
             if c in new_illegals_set:
@@ -350,9 +540,9 @@ class Gamestate:
 
     def remove_illegal(self, placement):
 
-        ''' Sets a placement's status to legal again '''
-        self.open_placements.remove(placement)
-        self.grid.mark_illegal(placement)
+        ''' Sets a placement's status to illegal '''
+        self.open_mask &= ~(1 << placement)
+        self.grid.mark_illegal(PLACEMENTS[placement])
 
     def update_player(self):
         self.player_up = (self.player_up + 1) % self.player_count
@@ -453,31 +643,32 @@ class Gamestate:
         return list(placements)
     
     def get_path_overlaps(self):
-        overlaps = {}
-        for i in range(self.player_count):
-            blockers = self.blockers[i]
-            for blocker in blockers:
-                if blocker not in overlaps:
-                    overlaps[blocker] = []
-                overlaps[blocker].append(i)
-        return overlaps
+        #placement code -> players whose path it blocks
+        return {blocker: self.get_blocked_players(blocker) for blocker in mask_codes(self.overlap_mask)}
+
+    def get_blocked_players(self, placement):
+        return [i for i, blockers in enumerate(self.blockers) if blockers >> placement & 1]
     
     def narrow_paths(self, candidates):
-        overlaps = self.get_path_overlaps()
-        cands = {cand: overlaps[cand] for cand in candidates if
-                 cand in overlaps}
+        overlaps = self.overlap_mask
+        cands = {cand: self.get_blocked_players(cand) for cand in candidates if
+                 overlaps >> cand & 1}
         return cands
                 
     def narrow_candidates(self, move):
-        touches = self.grid.get_touches(move)
+        #the wall geometry helpers work on placement tuples, candidates are returned as codes
+        placement = PLACEMENTS[move]
+        touches = self.grid.get_touches(placement)
         if touches == 0:
             return []
         elif touches == 1:
-            cands = self.get_immediate_placements(move)
+            cands = self.get_immediate_placements(placement)
         else:
-            cands = self.get_connected_placements(move)
-        cands = [cand for cand in cands if
-                 cand in self.open_placements
+            cands = self.get_connected_placements(placement)
+        open_mask = self.open_mask
+        cands = [code for cand in cands if
+                 (code := PLACEMENT_CODES.get(cand)) is not None
+                 and open_mask >> code & 1
                  and self.grid.get_touches(cand) == 2]
         return cands
     
@@ -485,24 +676,26 @@ class Gamestate:
         '''goes through all candidates with additional criteria of the players that may be affected'''
         illegals = []
         for candidate, players in candidates.items():
-            self.grid.add_wall(candidate)
+            placement = PLACEMENTS[candidate]
+            self.grid.add_wall(placement)
             for player in players:
                 position = self.player_positions[player]
-                if not self.grid.are_connected_greedy(position, self.goals[player]):
+                if not self.grid.reaches_goal(position, self.goal_masks[player]):
                     illegals.append(candidate)
                     break
-            self.grid.remove_wall(candidate)
+            self.grid.remove_wall(placement)
         return illegals
 
     def get_illegals_greedy(self, candidates):
         illegals = []
         for candidate in candidates:
-            self.grid.add_wall(candidate)
+            placement = PLACEMENTS[candidate]
+            self.grid.add_wall(placement)
             for i, position in enumerate(self.player_positions):
-                if not self.grid.are_connected_greedy(position, self.goals[i]):
+                if not self.grid.reaches_goal(position, self.goal_masks[i]):
                     illegals.append(candidate)
                     break
-            self.grid.remove_wall(candidate)
+            self.grid.remove_wall(placement)
         return illegals
 
     def has_won(self, player):
@@ -512,7 +705,7 @@ class Gamestate:
         return  self.player_positions[player][0] == t[player%2]
 
     def get_start_placements(self):
-        return {(x, y, r) for r in range(2) for x in range(8) for y in range(8)}
+        return ALL_PLACEMENTS
 
     def get_starting_goals(self):
         return [
@@ -531,12 +724,14 @@ class Gamestate:
         return get_display_string_pl(self.grid.arr, self.player_positions, 0, player_walls=self.player_walls) + f"player {symbs[self.player_up]} Winner: {symbs[self.winner] if self.winner is not None else 'N/A'}"  
     
     def move_is_placement(self, move):
-        return len(move) == 3 and type(move[2]) == int
+        return move < PAWN_BASE
     
     def show_path(self, path):
         # debugging method for visualizing paths
+        if self._shared:
+            self._unshare()
         for square in path:
-            self.grid.mark(square)
+            self.grid.mark(COORDS[square] if type(square) == int else square)
         print(self)
         self.grid.clear_all()
     
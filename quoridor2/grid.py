@@ -1,5 +1,5 @@
 import numpy as np
-from utils import get_display_string, get_display_string_pl #get_neighbors_numba
+from utils import get_display_string, get_display_string_pl
 from union_find import *
 import heapq
 
@@ -14,6 +14,9 @@ import heapq
 
 #array is rotated 90 degrees clockwise so that x and y can be input in that order
 
+#square index 9*y + x -> coords (index form used by paths and bit masks)
+COORDS = [(s % 9, s // 9) for s in range(81)]
+
 class SquareGrid:
     def get_clone(self):
         clone = SquareGrid()
@@ -23,6 +26,13 @@ class SquareGrid:
     def set_up_from_start(self):
         self.arr = self.get_empty_grid()
 
+    def snapshot(self):
+        #copy of the grid contents for undo records (see Gamestate.undo_move)
+        return self.arr.copy()
+
+    def restore(self, snapshot):
+        np.copyto(self.arr, snapshot)
+
 
     def is_illegal(self, placment):
         x, y, r = placment
@@ -95,9 +105,10 @@ class SquareGrid:
         x,y = coord
         return self.arr[x,y] & 64
     
-    def get_touches(self, placement):
+    @staticmethod
+    def get_touch_groups(placement):
+        #groups of wall faces at the west end, middle and east end (or south, middle, north) of a placement
         x, y, r = placement
-        touches = 0
         if r == 0:
             groups = [
                 [(x, y, 8), (x, y+1, 8)] + ([(x-1, y, 1)] if x > 0 else []),
@@ -110,8 +121,11 @@ class SquareGrid:
                 [(x, y, 1), (x+1, y, 1)],
                 [(x, y+1, 1), (x+1, y+1, 1)] + ([(x, y+2, 2)] if y < 7 else [])
             ]
+        return groups
 
-        for check in groups:
+    def get_touches(self, placement):
+        touches = 0
+        for check in self.get_touch_groups(placement):
             for t in check:
                 if self.has_wall(t[0], t[1], t[2]):
                     touches += 1
@@ -129,11 +143,6 @@ class SquareGrid:
     
     def get_neighbors(self, p):
         x, y = p
-
-        # neighbors_array = get_neighbors_numba(self.arr, x, y)
-
-        # g =  [tuple(coord) for coord in neighbors_array]
-        # return g
         barriers = (1, 2, 4, 8)
         cell_value = self.arr[x, y]  
         org = [
@@ -143,6 +152,40 @@ class SquareGrid:
 
         return org
     
+    def get_neighbor_indices(self, s):
+        #same as get_neighbors but with squares given as 9*y + x
+        return [9 * ny + nx for nx, ny in self.get_neighbors((s % 9, s // 9))]
+
+    def get_wall_bits(self, s):
+        #the N, E, S, W wall nibble of square index s
+        return self.arr[s % 9, s // 9] & 15
+
+    def is_occupied_index(self, s):
+        return self.arr[s % 9, s // 9] & 64
+
+    def has_adjacent_pawn(self, s):
+        return any(self.is_occupied(neighbor) for neighbor in self.get_neighbors(COORDS[s]))
+
+    def get_open_masks(self):
+        #(N, E, S, W) masks of the squares (bit 9*y + x) whose edge in that direction is open
+        masks = [0, 0, 0, 0]
+        for x in range(9):
+            for y in range(9):
+                cell_value = self.arr[x, y]
+                for i, barrier in enumerate((1, 2, 4, 8)):
+                    if not cell_value & barrier:
+                        masks[i] |= 1 << (9 * y + x)
+        return tuple(masks)
+
+    def get_illegal_mask(self):
+        #placement mask (bit r*64 + 8*y + x) of the placements flagged illegal
+        mask = 0
+        for x in range(8):
+            for y in range(8):
+                if self.arr[x, y] & 16: mask |= 1 << (8 * y + x)
+                if self.arr[x, y] & 32: mask |= 1 << (64 + 8 * y + x)
+        return mask
+
     ###########  LEGACY? No?  ######################
 
     def build_connectivity(self):
@@ -202,6 +245,10 @@ class SquareGrid:
                 heapq.heappush(open_set, (abs(neighbor[0] - p1x) + abs(neighbor[1] - p1y), neighbor))
         return False
     
+    def reaches_goal(self, p1, goal_mask):
+        #goal_mask has bit 9*y + x set for each goal square (see bitgrid.GOAL_MASKS)
+        return self.are_connected_greedy(p1, [(s % 9, s // 9) for s in range(81) if goal_mask >> s & 1])
+
     def astar_distance(self, target, goals):
         target_x, target_y = target
 
@@ -263,39 +310,56 @@ class SquareGrid:
 
         return None
     
-    def astar_full_path(self, start, goals):
-        if start in goals:
-            return [start]
-
+    def astar_full_path(self, start, goals, as_indices = False):
+        '''
+        A* from the goal set back to start, storing one parent index per square so the path is built once at the end.
+        Because the search runs goal -> start, following parents from start already yields the path in start -> goal order.
+
+        Args:
+            start: coords of the pawn
+            goals: iterable of goal coords
+            as_indices: return the path as bytes of square indices (9*y + x) instead of a list of coords
+
+        Returns:
+            the shortest path, or None if no goal can be reached
+        '''
+        sx, sy = start
+        target = 9 * sy + sx
+        parent = [-1] * 81
+        cost_so_far = [81] * 81
         frontier = []
-        cost_so_far = {}
 
-        for goal in goals:
-            cost = 0
-            heuristic = abs(goal[0] - start[0]) + abs(goal[1] - start[1])
-            priority = cost + heuristic
-            heapq.heappush(frontier, (priority, cost, goal, [goal]))
-            cost_so_far[goal] = cost
+        for gx, gy in goals:
+            g = 9 * gy + gx
+            parent[g] = g
+            cost_so_far[g] = 0
+            heapq.heappush(frontier, (abs(gx - sx) + abs(gy - sy), 0, g))
 
         while frontier:
-            priority, cost, current, path = heapq.heappop(frontier)
-            
-
-            # If the start is reached, reverse the path so that it goes from start to goal.
-            if current == start:
-                return path[::-1]
-
-            for neighbor in self.get_neighbors(current):
-                new_cost = cost + 1  # all moves have a cost of 1
-                if neighbor not in cost_so_far or new_cost < cost_so_far[neighbor]:
+            _, cost, current = heapq.heappop(frontier)
+            if current == target:
+                break
+            if cost > cost_so_far[current]:
+                continue
+            new_cost = cost + 1  # all moves have a cost of 1
+            for neighbor in self.get_neighbor_indices(current):
+                if new_cost < cost_so_far[neighbor]:
                     cost_so_far[neighbor] = new_cost
-                    heuristic = abs(neighbor[0] - start[0]) + abs(neighbor[1] - start[1])
-                    new_priority = new_cost + heuristic
-                    new_path = path + [neighbor]
-                    heapq.heappush(frontier, (new_priority, new_cost, neighbor, new_path))
+                    parent[neighbor] = current
+                    heuristic = abs(neighbor % 9 - sx) + abs(neighbor // 9 - sy)
+                    heapq.heappush(frontier, (new_cost + heuristic, new_cost, neighbor))
+        else:
+            # No path found
+            return None
 
-        # No path found
-        return None
+        path = [target]
+        s = target
+        while parent[s] != s:
+            s = parent[s]
+            path.append(s)
+        if as_indices:
+            return bytes(path)
+        return [COORDS[s] for s in path]
     
     def __repr__(self):
         return str(self.arr)
@@ -1,4 +1,5 @@
 from player import Player
+from moves import encode_move, decode_move
 
 class Human(Player):
     def get_move(self, gamestate):
@@ -12,11 +13,11 @@ class Human(Player):
             while True:
                 choice = str_to_move(input("enter move: "))
                 if choice == "o":
-                    print(gamestate.get_legal_moves())
+                    print([decode_move(move) for move in gamestate.get_legal_moves()])
                 else:
                     if choice in gamestate.get_legal_moves():
                         break
-                    print(f"{choice} is not a legal move. For options enter \"o\" ")
+                    print(f"{decode_move(choice) if choice is not None else None} is not a legal move. For options enter \"o\" ")
             g = gamestate.get_clone()
             g.play_move(choice)
             print(g)
@@ -26,6 +27,7 @@ class Human(Player):
         return choice
 
 def str_to_move(str1):
+    #parses "x,y,r" (wall), "x,y" (step) or "x1,y1;x2,y2" (jump) into a move code
     try:
         if str1 == "o":
             return str1
@@ -35,8 +37,15 @@ def str_to_move(str1):
         for comp in components:
             g.append(tuple([int(val) for val in comp.split(",")]))
         if len(g) > 1:
-            return tuple(g)
-        return g[0]
+            return encode_move(tuple(g))
+        return encode_move(g[0])
     except:
         return None
+
+def move_to_str(move):
+    #inverse of str_to_move
+    move = decode_move(move)
+    if type(move[0]) != int:
+        return ";".join(",".join(str(v) for v in part) for part in move)
+    return ",".join(str(v) for v in move)
     
@@ -1,4 +1,5 @@
-from gamestate import Gamestate
+from calcstate import Calcstate
+from moves import is_placement
 from random import choice,shuffle
 import multiprocessing
 
@@ -26,7 +27,9 @@ import math
 
 class MctsNode:
     def __init__(self, gamestate, player, reached_by=None, parent = None):
-        self.gamestate = gamestate.get_clone()
+        #rollouts need the Calcstate methods (get_rollout_move*, try_early_eval), a Gamestate is imported copy on write
+        self.gamestate = Calcstate()
+        self.gamestate.import_gamestate(gamestate)
         self.reached_by = reached_by
         self.player = player
         self.parent = parent
@@ -98,7 +101,7 @@ class MctsNode:
             rollie.try_early_eval()
  
         # if the move that got us here was a pawn move
-        if len(self.reached_by) == 2:
+        if not is_placement(self.reached_by):
             return [1] if rollie.winner == self.player else [0]
         return [1]if rollie.winner == self.player else [0]
     
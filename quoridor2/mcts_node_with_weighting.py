@@ -1,4 +1,4 @@
-from gamestate import Gamestate
+from calcstate import Calcstate
 from random import choice,shuffle
 import multiprocessing
 
@@ -27,7 +27,9 @@ import math
 class MctsNodeWeighted:
     def __init__(self, gamestate, player, reached_by=None, parent = None, depth = 0):
         self.depth = depth
-        self.gamestate = gamestate.get_clone()
+        #rollouts need the Calcstate methods (get_rollout_move*, try_early_eval), a Gamestate is imported copy on write
+        self.gamestate = Calcstate()
+        self.gamestate.import_gamestate(gamestate)
         self.reached_by = reached_by
         self.player = player
         self.parent = parent
@@ -0,0 +1,52 @@
+'''
+Static pawn move tables, built once at import.
+
+Squares are indexed 9*y + x and the local walls of a square are the 4 bit nibble of the array grid
+(N = 1, E = 2, S = 4, W = 8, board edges count as walls). Given a square and its nibble the tables hold every
+step (and, for a neighbouring pawn, every jump) in the same order Gamestate has always produced them.
+
+    STEPS[s][bits]         tuple of (direction, neighbour index) for the open sides of s, N E S W order
+    STEP_MOVES[s][bits]    the same neighbours as coord tuples
+    NEIGHBOR_INDICES[s][bits]  the same neighbours as square indices
+    STEP_CODES[s][bits]    the same neighbours as pawn step move codes (see moves.py)
+    JUMPS[n][bits][d]      jump move codes over a pawn on square n entered from direction d (0-3 = N E S W):
+                           the straight jump if n's far side is open, otherwise the sidesteps off of n
+    ADJACENT[s]            square mask of the (up to 4) squares touching s, walls ignored
+'''
+
+from grid import COORDS
+from moves import step_code, jump_code
+
+DELTAS = (9, 1, -9, -1)
+OFFSETS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+
+def _open_sides(s, bits):
+    x, y = COORDS[s]
+    sides = []
+    for d, (dx, dy) in enumerate(OFFSETS):
+        if not bits & (1 << d) and 0 <= x + dx < 9 and 0 <= y + dy < 9:
+            sides.append((d, s + DELTAS[d]))
+    return tuple(sides)
+
+
+STEPS = [[_open_sides(s, bits) for bits in range(16)] for s in range(81)]
+STEP_MOVES = [[tuple(COORDS[n] for _, n in STEPS[s][bits]) for bits in range(16)] for s in range(81)]
+NEIGHBOR_INDICES = [[tuple(n for _, n in STEPS[s][bits]) for bits in range(16)] for s in range(81)]
+STEP_CODES = [[tuple(step_code(n) for _, n in STEPS[s][bits]) for bits in range(16)] for s in range(81)]
+
+JUMPS = []
+for _n in range(81):
+    _by_bits = []
+    for _bits in range(16):
+        _by_dir = []
+        for _d in range(4):
+            _back = (_d + 2) % 4
+            _sides = [(side, landing) for side, landing in STEPS[_n][_bits] if side != _back]
+            _straight = [landing for side, landing in _sides if side == _d]
+            _landings = _straight if _straight else [landing for _, landing in _sides]
+            _by_dir.append(tuple(jump_code(_n, landing) for landing in _landings))
+        _by_bits.append(tuple(_by_dir))
+    JUMPS.append(tuple(_by_bits))
+
+ADJACENT = [sum(1 << n for _, n in STEPS[s][0]) for s in range(81)]
@@ -0,0 +1,142 @@
+'''
+Integer move codes used by Gamestate, Calcstate and the bots.
+
+    0   - 127   wall placement (x, y, r)              code = 64*r + 8*y + x
+    128 - 208   pawn step to square s                 code = PAWN_BASE + s
+    209 - 532   jump over a pawn, landing on square s  code = JUMP_BASE + 81*d + s
+                (d = 0-3 = N E S W, the direction from the jumped pawn to s)
+
+Squares are indexed 9*y + x. A code fully describes its move, so decode_move needs no position, and
+placement codes double as bit positions in placement masks.
+Sets of placements are kept as 128 bit masks (bit c = placement code c); mask_codes and nth_code read them back.
+The old tuple forms ((x, y, r), (x, y) and ((x1, y1), (x2, y2))) are still accepted by encode_move for human I/O.
+'''
+
+PLACEMENT_COUNT = 128
+PAWN_BASE = 128
+JUMP_BASE = PAWN_BASE + 81
+MOVE_COUNT = JUMP_BASE + 4 * 81
+
+SQUARE_DELTAS = (9, 1, -9, -1)
+
+ALL_PLACEMENTS = (1 << PLACEMENT_COUNT) - 1
+
+PLACEMENTS = [(c % 8, c // 8 % 8, c // 64) for c in range(PLACEMENT_COUNT)]
+PLACEMENT_CODES = {placement: c for c, placement in enumerate(PLACEMENTS)}
+
+
+def placement_code(x, y, r):
+    return 64 * r + 8 * y + x
+
+
+def step_code(s):
+    return PAWN_BASE + s
+
+
+def jump_code(over, landing):
+    return JUMP_BASE + 81 * SQUARE_DELTAS.index(landing - over) + landing
+
+
+def is_placement(code):
+    return code < PAWN_BASE
+
+
+def is_jump(code):
+    return code >= JUMP_BASE
+
+
+def move_destination(code):
+    '''returns the square index a pawn move ends on'''
+    if code < JUMP_BASE:
+        return code - PAWN_BASE
+    return (code - JUMP_BASE) % 81
+
+
+def jump_over(code):
+    '''returns the square index of the pawn a jump passes over'''
+    d, landing = divmod(code - JUMP_BASE, 81)
+    return landing - SQUARE_DELTAS[d]
+
+
+def encode_move(move):
+    '''
+    Converts a move tuple into its code (codes are returned unchanged)
+
+    Args:
+        move: (x, y, r), (x, y) or ((x1, y1), (x2, y2))
+    '''
+    if type(move) == int:
+        return move
+    if type(move[0]) != int:
+        (x1, y1), (x2, y2) = move
+        if abs(x1 - x2) + abs(y1 - y2) != 1 or not all(0 <= v < 9 for v in (x1, y1, x2, y2)):
+            raise ValueError(f"not a jump: {move}")
+        return jump_code(9 * y1 + x1, 9 * y2 + x2)
+    if len(move) == 3:
+        return PLACEMENT_CODES[move]
+    x, y = move
+    if not (0 <= x < 9 and 0 <= y < 9):
+        raise ValueError(f"not a square: {move}")
+    return step_code(9 * y + x)
+
+
+def decode_move(code):
+    '''Converts a move code back into the tuple form used for display and human input'''
+    if code < PAWN_BASE:
+        return PLACEMENTS[code]
+    landing = move_destination(code)
+    if code < JUMP_BASE:
+        return (landing % 9, landing // 9)
+    over = jump_over(code)
+    return ((over % 9, over // 9), (landing % 9, landing // 9))
+
+
+# placement code -> codes that can no longer be placed once it is (itself, overlapping and crossing placements)
+PHYSICAL_CONFLICTS = []
+for _x, _y, _r in PLACEMENTS:
+    _conflicts = []
+    for _d in (-1, 0, 1):
+        _nx, _ny = (_x + _d, _y) if _r == 0 else (_x, _y + _d)
+        if 0 <= _nx < 8 and 0 <= _ny < 8:
+            _conflicts.append(placement_code(_nx, _ny, _r))
+    _conflicts.append(placement_code(_x, _y, 1 - _r))
+    PHYSICAL_CONFLICTS.append(tuple(_conflicts))
+CONFLICT_MASKS = [sum(1 << c for c in conflicts) for conflicts in PHYSICAL_CONFLICTS]
+
+
+# byte value -> the set bit positions of that byte offset by 8*k, for reading masks a byte at a time
+BYTE_CODES = [[tuple(8 * _k + _i for _i in range(8) if _b >> _i & 1) for _b in range(256)] for _k in range(PLACEMENT_COUNT // 8)]
+
+
+def mask_codes(mask):
+    '''returns the set bit positions of a placement mask as a list, lowest first'''
+    codes = []
+    k = 0
+    while mask:
+        byte = mask & 0xFF
+        if byte:
+            codes.extend(BYTE_CODES[k][byte])
+        mask >>= 8
+        k += 1
+    return codes
+
+
+def nth_code(mask, n):
+    '''
+    Returns the position of the nth (0 based) set bit of mask without listing the bits.
+    The mask is halved 7 times, keeping the half that holds the bit, so the cost does not depend on the count.
+    n must be less than mask.bit_count().
+    '''
+    base = 0
+    width = PLACEMENT_COUNT // 2
+    while width:
+        low = mask & ((1 << width) - 1)
+        count = low.bit_count()
+        if n < count:
+            mask = low
+        else:
+            n -= count
+            mask >>= width
+            base += width
+        width >>= 1
+    return base
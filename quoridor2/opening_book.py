@@ -0,0 +1,236 @@
+'''
+Opening book: per move visit and win statistics of searched positions, keyed by Calcstate's Zobrist hash.
+
+Every game starts from the same position, so the searches of the first moves repeat from game to game. The book keeps
+their results in a file of fixed size records sorted by (hash, move), opened as a read only numpy memmap so looking up
+a position is a binary search that only touches a few pages, however large the file is.
+
+    record   hash (uint64), move (uint16), visits (uint32), wins (float32)
+             wins are summed results for the player to move in the position, so wins / visits is that move's q
+
+The Zobrist keys come from a fixed seed (see calcstate.py), so hashes stay valid across processes and runs.
+A canonical book keys positions by Calcstate.get_canonical (any symmetry, the statistics are for the player to move)
+with moves stored in the canonical orientation, so the mirror images of a position share their entries. Hashes of
+canonical and plain books do not mix, open a book the way it was built.
+New statistics are collected in memory (add / add_search) and merged into the file by save.
+
+Command line:
+    python opening_book.py grow BOOK [--games 20] [--plies 6] [--expansions 2000] [--players 2] [--canonical]
+    python opening_book.py merge OUT BOOK [BOOK ...]
+    python opening_book.py prune BOOK [--min-visits 50] [--out OUT]
+    python opening_book.py show BOOK [--canonical]
+'''
+
+import numpy as np
+import argparse, os, random, time
+from calcstate import Calcstate
+from base_mcts_bot import BaseMCTSbot
+from symmetry import to_canonical, from_canonical
+
+RECORD = np.dtype([("hash", "<u8"), ("move", "<u2"), ("visits", "<u4"), ("wins", "<f4")])
+
+
+class OpeningBook:
+    def __init__(self, path = None, min_visits = 1000, min_share = 0.2, canonical = False):
+        '''
+        Args:
+            path: book file to open, a missing file is an empty book (save creates it)
+            min_visits: visits a position needs before choose trusts it
+            min_share: share of the position's visits the most visited move needs before choose plays it
+            canonical: key positions and moves by their canonical orientation (see above)
+        '''
+        self.path = path
+        self.min_visits = min_visits
+        self.min_share = min_share
+        self.canonical = canonical
+        # hash -> move -> [visits, wins] not yet saved
+        self.pending = {}
+        self.records = np.zeros(0, RECORD)
+        if path is not None and os.path.exists(path) and os.path.getsize(path):
+            self.records = np.memmap(path, dtype=RECORD, mode="r")
+
+    def __len__(self):
+        return len(self.records)
+
+    ##############################  Lookup  ###############################
+
+    def lookup(self, h):
+        '''
+        Returns:
+            dict of move -> (visits, wins) for calcstate hash h, from the file and the unsaved additions
+        '''
+        hashes = self.records["hash"]
+        lo = np.searchsorted(hashes, np.uint64(h), side="left")
+        hi = np.searchsorted(hashes, np.uint64(h), side="right")
+        entries = {int(r["move"]): (int(r["visits"]), float(r["wins"])) for r in self.records[lo:hi]}
+        for move, (extra_visits, extra_wins) in self.pending.get(h, {}).items():
+            visits, wins = entries.get(move, (0, 0.0))
+            entries[move] = (visits + extra_visits, wins + extra_wins)
+        return entries
+
+    def choose(self, calcstate):
+        '''
+        Returns:
+            the book move for calcstate's position if the book is confident in it (see min_visits, min_share), else None
+        '''
+        h, symmetry = self.get_key(calcstate)
+        entries = self.lookup(h)
+        if not entries:
+            return None
+        total = sum(visits for visits, _ in entries.values())
+        move, (visits, _) = max(entries.items(), key=lambda kv: kv[1][0])
+        if total < self.min_visits or visits < self.min_share * total:
+            return None
+        move = from_canonical(symmetry, move)
+        # a hash collision could bring up a move from another position
+        return move if calcstate.is_legal_move(move) else None
+
+    def get_key(self, calcstate):
+        '''
+        Returns:
+            (book hash of calcstate's position, symmetry mapping its moves to the stored ones or None)
+        '''
+        if self.canonical:
+            return calcstate.get_canonical(keep_players = False)
+        return calcstate.get_hash(), None
+
+    ##############################  Building  ###############################
+
+    def add(self, h, move, visits, wins):
+        entry = self.pending.setdefault(h, {}).setdefault(move, [0, 0.0])
+        entry[0] += visits
+        entry[1] += wins
+
+    def add_search(self, calcstate, root_statistics):
+        #adds the move -> (N, W) root statistics of a search of calcstate (see BaseMCTSbot.get_root_statistics)
+        h, symmetry = self.get_key(calcstate)
+        for move, (visits, wins) in root_statistics.items():
+            if visits:
+                self.add(h, to_canonical(symmetry, move), visits, wins)
+
+    def save(self, path = None):
+        '''Merges the unsaved additions into the records and writes them (to path, by default the book's own file)'''
+        path = path or self.path
+        added = np.array([(h, move, visits, wins) for h, moves in self.pending.items()
+                          for move, (visits, wins) in moves.items()], RECORD)
+        self.records = merge_records([np.array(self.records), added])
+        self.pending = {}
+        write_records(self.records, path)
+        self.path = path
+        self.records = np.memmap(path, dtype=RECORD, mode="r") if len(self.records) else self.records
+
+    def prune(self, min_visits):
+        #drops the positions searched fewer than min_visits times in total (call save to write the result)
+        records = np.array(self.records)
+        if len(records) == 0:
+            return 0
+        starts = np.flatnonzero(np.r_[True, records["hash"][1:] != records["hash"][:-1]])
+        totals = np.add.reduceat(records["visits"].astype(np.int64), starts)
+        keep = np.repeat(totals >= min_visits, np.diff(np.r_[starts, len(records)]))
+        self.records = records[keep]
+        return int((~keep).sum())
+
+
+def merge_records(arrays):
+    '''sorts record arrays together by (hash, move) and sums the visits and wins of duplicate keys'''
+    records = np.concatenate(arrays)
+    if len(records) == 0:
+        return records
+    records = records[np.lexsort((records["move"], records["hash"]))]
+    new_key = np.r_[True, (records["hash"][1:] != records["hash"][:-1]) | (records["move"][1:] != records["move"][:-1])]
+    starts = np.flatnonzero(new_key)
+    merged = records[starts].copy()
+    merged["visits"] = np.add.reduceat(records["visits"].astype(np.int64), starts).clip(0, 2**32 - 1)
+    merged["wins"] = np.add.reduceat(records["wins"].astype(np.float64), starts)
+    return merged
+
+
+def write_records(records, path):
+    #writes to a temporary file first so readers never map a half written book
+    temporary = path + ".tmp"
+    records.tofile(temporary)
+    os.replace(temporary, path)
+
+
+def grow(book, games, plies, expansions, player_count = 2, verbose = True):
+    '''
+    Self-play that adds a BaseMCTSbot search of every position of the first plies plies of each game to book.
+    Moves are drawn in proportion to their visits so the games spread over the likely openings.
+    '''
+    bot = BaseMCTSbot(expansions, reuse_tree = False, verbose = False)
+    for game in range(games):
+        state = Calcstate()
+        state.set_up_as_start(player_count)
+        line = []
+        for ply in range(plies):
+            if state.over:
+                break
+            move = bot.choose_move(state)
+            stats = bot.get_root_statistics()
+            #endgame moves come without a search, there is nothing to add for them
+            if stats:
+                book.add_search(state, stats)
+                moves = list(stats)
+                move = random.choices(moves, weights = [stats[m][0] for m in moves])[0]
+            state.play_move(move)
+            line.append(move)
+        if verbose:
+            print(f"game {game + 1}/{games}: {line}")
+    bot.close()
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "grow, merge, prune and inspect opening book files")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    grow_parser = commands.add_parser("grow", help = "add self-play searches to a book")
+    grow_parser.add_argument("book")
+    grow_parser.add_argument("--games", type = int, default = 20)
+    grow_parser.add_argument("--plies", type = int, default = 6)
+    grow_parser.add_argument("--expansions", type = int, default = 2000)
+    grow_parser.add_argument("--players", type = int, default = 2)
+    grow_parser.add_argument("--seed", type = int, default = None)
+    grow_parser.add_argument("--canonical", action = "store_true", help = "key positions by their canonical orientation")
+    merge_parser = commands.add_parser("merge", help = "sum several books into one")
+    merge_parser.add_argument("out")
+    merge_parser.add_argument("books", nargs = "+")
+    prune_parser = commands.add_parser("prune", help = "drop rarely searched positions")
+    prune_parser.add_argument("book")
+    prune_parser.add_argument("--min-visits", type = int, default = 50)
+    prune_parser.add_argument("--out", default = None)
+    show_parser = commands.add_parser("show", help = "print a book's size and its start position entries")
+    show_parser.add_argument("book")
+    show_parser.add_argument("--players", type = int, default = 2)
+    show_parser.add_argument("--canonical", action = "store_true", help = "the book was grown with --canonical")
+    args = parser.parse_args(args)
+
+    if args.command == "grow":
+        if args.seed is not None:
+            random.seed(args.seed)
+        book = OpeningBook(args.book, canonical = args.canonical)
+        start = time.time()
+        grow(book, args.games, args.plies, args.expansions, args.players)
+        book.save()
+        print(f"{len(book)} records after {time.time() - start:.0f}s")
+    elif args.command == "merge":
+        records = merge_records([np.array(OpeningBook(path).records) for path in args.books])
+        write_records(records, args.out)
+        print(f"{len(records)} records")
+    elif args.command == "prune":
+        book = OpeningBook(args.book)
+        dropped = book.prune(args.min_visits)
+        book.save(args.out)
+        print(f"dropped {dropped} records, {len(book)} left")
+    elif args.command == "show":
+        book = OpeningBook(args.book, canonical = args.canonical)
+        positions = len(np.unique(book.records["hash"])) if len(book) else 0
+        print(f"{len(book)} records, {positions} positions")
+        state = Calcstate()
+        state.set_up_as_start(args.players)
+        entries = sorted(book.lookup(book.get_key(state)[0]).items(), key=lambda kv: -kv[1][0])
+        for move, (visits, wins) in entries[:10]:
+            print(f"  {move}: {visits} visits, q {wins / visits:.3f}")
+        print(f"book move: {book.choose(state)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from base_mcts_bot import BaseMCTSbot
+from calcstate import Calcstate
+from gamestate import Gamestate
+from multiprocessing import Pool, cpu_count
+import random, time
+
+# Root parallel MCTS: every worker process runs an independent BaseMCTSbot search of the same position and the
+# visit counts of the root's children are summed to pick the move. The pool lives as long as the bot, and positions
+# travel as Gamestate.serialize tuples (a few hundred bytes) instead of pickled object graphs.
+
+_worker_bot = None
+
+
+def _start_worker(expansions, search_options):
+    #pool initializer: one quiet search bot per worker process, reused for every task
+    global _worker_bot
+    _worker_bot = BaseMCTSbot(expansions, verbose = False, reuse_tree = False, **search_options)
+
+
+def _search_worker(task):
+    '''
+    Runs one search in a worker process
+
+    Args:
+        task: (serialized position, random seed)
+
+    Returns:
+        dict of move -> (N, W) for the root's children
+    '''
+    data, task_seed = task
+    # forked workers start with copies of the parent's random state, so every task is reseeded
+    random.seed(task_seed)
+    calcstate = Calcstate()
+    calcstate.load_serialized(data)
+    _worker_bot.choose_move(calcstate)
+    return _worker_bot.get_root_statistics()
+
+
+class RootParallelMCTSbot(BaseMCTSbot):
+    def __init__(self, expansions, workers = None, verbose = True, opening_book = None, **search_options):
+        '''
+        Args:
+            expansions: search iterations per worker, a move costs about as long as one BaseMCTSbot(expansions) search
+            workers: number of worker processes (defaults to the cpu count)
+            verbose: print a summary of every search
+            opening_book: OpeningBook consulted here before the workers search (see BaseMCTSbot)
+            search_options: other BaseMCTSbot options used by the workers (make_unmake, use_transpositions, table_size),
+                            endgame_oracle also decides whether positions without walls left are solved here instead
+        '''
+        super().__init__(expansions, verbose = verbose, reuse_tree = False, opening_book = opening_book, **search_options)
+        self.workers = workers or cpu_count()
+        self.search_options = search_options
+        self.pool = None
+        self.root_totals = {}
+
+    def get_pool(self):
+        #created on first use and kept, starting processes per move costs more than a small search
+        if self.pool is None:
+            self.pool = Pool(self.workers, initializer = _start_worker, initargs = (self.expansion_count, self.search_options))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        super().close()
+
+    def choose_move(self, gamestate):
+        self.player_id = gamestate.player_up
+        self.root_totals = {}
+        if self.opening_book is not None or self.endgame is not None:
+            calcstate = Calcstate()
+            calcstate.import_gamestate(gamestate)
+            book_move = self._book_move(calcstate)
+            if book_move is not None:
+                return book_move
+            endgame_move = self._endgame_move(calcstate)
+            if endgame_move is not None:
+                return endgame_move
+        data = gamestate.serialize()
+        tasks = [(data, random.getrandbits(64)) for _ in range(self.workers)]
+
+        totals = {}
+        for stats in self.get_pool().map(_search_worker, tasks):
+            for move, (n, w) in stats.items():
+                total_n, total_w = totals.get(move, (0, 0.0))
+                totals[move] = (total_n + n, total_w + w)
+        self.root_totals = totals
+
+        best_move = max(totals.items(), key=lambda kv: kv[1][0])[0]
+        if self.verbose:
+            n, w = totals[best_move]
+            print(f"{self.workers} workers, {sum(t[0] for t in totals.values())} root visits, best {best_move} ({n} visits, q {w / n:.3f})")
+        return best_move
+
+    def get_root_statistics(self):
+        return self.root_totals
+
+
+if __name__ == "__main__":
+    # simulations per second as the number of workers grows (each worker runs the same number of iterations)
+    random.seed("bagel")
+    g = Gamestate()
+    g.set_up_as_start(2)
+    for workers in sorted({1, 2, 4, cpu_count()}):
+        bot = RootParallelMCTSbot(500, workers = workers, verbose = False)
+        bot.get_pool()
+        start = time.time()
+        bot.choose_move(g)
+        elapsed = time.time() - start
+        print(f"{workers} workers: {workers * 500 / elapsed:.0f} simulations/s")
+        bot.close()
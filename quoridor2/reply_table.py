@@ -1,30 +1,109 @@
 from collections import OrderedDict
+from array import array
+import sys
+
+# every state keeps its replies in one flat array of doubles, 3 slots per reply: move, n, mu.
+# It grows a reply at a time up to per_state_cap replies, after that a new reply replaces the least wanted one.
+SLOT = 3
+# bytes of a state's store entry besides its array: the hash key and the OrderedDict's per item share
+STATE_OVERHEAD = sys.getsizeof(1 << 63) + 100
+
 
 class OppReplyTable:
-    def __init__(self, cap_states = 100000, per_state_cap=6):
+    '''
+    LRU map from Calcstate hash to the replies seen from that position, each with a visit count and running mean result.
+    Per position it keeps the per_state_cap replies with the lowest means (keep = "lowest") or the highest ones
+    (keep = "highest"). TableMCTSbot records results from its own point of view, so the lowest are the opponent's strongest.
+    The table holds at most cap_states positions, or positions worth max_bytes of memory if that is given.
+    get counts hits and misses and update counts the states evicted to stay in bounds.
+    '''
+    def __init__(self, cap_states = 100000, per_state_cap=6, keep = "lowest", max_bytes = None):
+        if keep not in ("lowest", "highest"):
+            raise ValueError(f"keep must be \"lowest\" or \"highest\", not {keep!r}")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, not {max_bytes}")
         self.cap_states = cap_states
         self.k = per_state_cap
+        # means are compared multiplied by sign, so the most wanted reply is always the smallest
+        self.sign = 1.0 if keep == "lowest" else -1.0
+        self.max_bytes = max_bytes
+        self.bytes = 0
         self.store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, h):
-        '''returns entry for calcstate hash'''
-        d = self.store.get(h)
-        if d is not None:
-            self.store.move_to_end(h)
-        return d
-    
+        '''
+        Returns:
+            the replies stored for calcstate hash h as (move, n, mu) tuples, most wanted first (None if h is not stored)
+        '''
+        slots = self.store.get(h)
+        if slots is None:
+            self.misses += 1
+            return None
+        self.store.move_to_end(h)
+        self.hits += 1
+        replies = [(int(slots[i]), int(slots[i + 1]), slots[i + 2]) for i in range(0, len(slots), SLOT)]
+        replies.sort(key=lambda reply: self.sign * reply[2])
+        return replies
+
+    def best(self, h):
+        '''the most wanted stored reply for calcstate hash h, or None (counted as a hit or miss like get)'''
+        slots = self.store.get(h)
+        if slots is None:
+            self.misses += 1
+            return None
+        self.store.move_to_end(h)
+        self.hits += 1
+        sign = self.sign
+        best = 0
+        for i in range(SLOT, len(slots), SLOT):
+            if sign * slots[i + 2] < sign * slots[best + 2]:
+                best = i
+        return int(slots[best])
+
     def update(self, h, move, R):
-        '''updates table entry for calcstate hash and move made based on result'''
-        d = self.get(h)
-        if d is None:
-            if len(self.store) >= self.cap_states:
-                self.store.popitem(last=False)
-            d = self.store[h] = {}
-        n, mu = d.get(move, (0, 0.0))
-        n = min(65535, n+1)
-        mu = mu + (R - mu) / n
-        d[move] = (n, mu)
-
-        if len(d) > self.k:
-            worst = sorted(d.items(), key=lambda kv: kv[1][1])[:self.k]
-            self.store[h] = dict(worst)
\ No newline at end of file
+        '''updates table entry for calcstate hash and move made based on result, O(per_state_cap)'''
+        store = self.store
+        slots = store.get(h)
+        if slots is None:
+            slots = store[h] = array("d", (move, 1, R))
+            self.bytes += STATE_OVERHEAD + sys.getsizeof(slots)
+            self._shrink()
+            return
+        store.move_to_end(h)
+
+        # the reply's slot, and the least wanted slot in case the reply is new and there is no room for it
+        sign = self.sign
+        worst = 0
+        for i in range(0, len(slots), SLOT):
+            if slots[i] == move:
+                n = min(65535, slots[i + 1] + 1)
+                slots[i + 1] = n
+                slots[i + 2] += (R - slots[i + 2]) / n
+                return
+            if sign * slots[i + 2] > sign * slots[worst + 2]:
+                worst = i
+
+        if len(slots) < SLOT * self.k:
+            size = sys.getsizeof(slots)
+            slots.extend((move, 1, R))
+            self.bytes += sys.getsizeof(slots) - size
+            self._shrink()
+        elif sign * R < sign * slots[worst + 2]:
+            slots[worst], slots[worst + 1], slots[worst + 2] = move, 1, R
+
+    def _shrink(self):
+        #evicts least recently used states until the table is within cap_states (or max_bytes)
+        store = self.store
+        while len(store) > 1 and (self.bytes > self.max_bytes if self.max_bytes is not None else len(store) > self.cap_states):
+            _, slots = store.popitem(last=False)
+            self.bytes -= STATE_OVERHEAD + sys.getsizeof(slots)
+            self.evictions += 1
+
+    def get_stats(self):
+        return {"states": len(self.store), "bytes": self.bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self.store)
@@ -0,0 +1,121 @@
+'''
+Board symmetries as lookup tables over squares, wall nibbles, placements and move codes.
+
+Each of the 8 symmetries of the square board is a 2x2 matrix acting on coordinates centred on the middle square.
+Squares are centred at 4 and wall placements (anchored on the corner between squares x, x+1 and y, y+1) at 3.5, so
+mirroring x -> 8 - x sends the placement (x, y, r) to (7 - x, y, r). Directions (N, E, S, W) follow the matrix too,
+which turns the wall nibble of a square and the direction of a jump code.
+
+A symmetry maps the game onto itself for a player count when it moves every player's start square onto a start
+square (players[i] is the player seated there, same goal), and keeps the turn order. That leaves:
+    2 players   mirror x -> 8 - x (players kept), rotation by 180 degrees and mirror y -> 8 - y (players swapped)
+    3 players   none
+    4 players   the diagonal x <-> y (players 0 <-> 2 and 1 <-> 3). Starting order 0, 1, 2, 3 runs bottom, top,
+                left, right, so no rotation keeps it.
+Symmetries that keep the players are the ones tables keyed from a fixed player's point of view (search trees,
+reply tables) can share. See Calcstate.get_canonical for the canonical hash.
+'''
+
+from moves import PLACEMENTS, PLACEMENT_CODES, PAWN_BASE, JUMP_BASE, MOVE_COUNT
+from bitgrid import GOAL_MASKS
+
+START_SQUARES = [(4, 0), (4, 8), (0, 4), (8, 4)]
+# N, E, S, W as (dx, dy), in the order of the wall nibble bits and of jump codes
+DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+MATRICES = {
+    "mirror x": ((-1, 0), (0, 1)),
+    "mirror y": ((1, 0), (0, -1)),
+    "rotate 180": ((-1, 0), (0, -1)),
+    "diagonal": ((0, 1), (1, 0)),
+    "antidiagonal": ((0, -1), (-1, 0)),
+    "rotate 90": ((0, -1), (1, 0)),
+    "rotate 270": ((0, 1), (-1, 0)),
+}
+
+
+class Symmetry:
+    '''
+    One board symmetry:
+        squares[s]     image of square s (9*y + x)
+        nibbles[b]     image of an N/E/S/W wall nibble
+        moves[code]    image of a move code (placements, steps and jumps)
+        players[i]     player who takes player i's role
+        inverse        the symmetry undoing this one
+    '''
+    def __init__(self, name, matrix):
+        (a, b), (c, d) = matrix
+        self.name = name
+
+        def transform(x, y, centre):
+            u, v = x - centre, y - centre
+            return a * u + b * v + centre, c * u + d * v + centre
+
+        self.squares = []
+        for s in range(81):
+            x, y = transform(s % 9, s // 9, 4)
+            self.squares.append(9 * y + x)
+
+        directions = [DIRECTIONS.index((a * dx + b * dy, c * dx + d * dy)) for dx, dy in DIRECTIONS]
+        self.nibbles = [sum(1 << directions[i] for i in range(4) if bits >> i & 1) for bits in range(16)]
+
+        self.moves = [0] * MOVE_COUNT
+        for code, (x, y, r) in enumerate(PLACEMENTS):
+            tx, ty = transform(x, y, 3.5)
+            # a horizontal wall runs east - west, it stays horizontal if east goes to east or west
+            turned = directions[1] in (0, 2)
+            self.moves[code] = PLACEMENT_CODES[(int(tx), int(ty), r ^ turned)]
+        for s in range(81):
+            self.moves[PAWN_BASE + s] = PAWN_BASE + self.squares[s]
+            for direction in range(4):
+                self.moves[JUMP_BASE + 81 * direction + s] = JUMP_BASE + 81 * directions[direction] + self.squares[s]
+
+        starts = [9 * y + x for x, y in START_SQUARES]
+        self.players = [starts.index(self.squares[start]) for start in starts]
+        self.inverse = None
+
+    def maps_game(self, player_count):
+        #True if the symmetry takes the start position of player_count players to itself, with the same turn order
+        players = self.players[:player_count]
+        if sorted(players) != list(range(player_count)):
+            return False
+        for i in range(player_count):
+            if self.map_mask(GOAL_MASKS[i]) != GOAL_MASKS[players[i]]:
+                return False
+            if players[(i + 1) % player_count] != (players[i] + 1) % player_count:
+                return False
+        return True
+
+    def keeps_players(self, player_count):
+        return self.players[:player_count] == list(range(player_count))
+
+    def map_mask(self, mask):
+        #image of a square mask
+        image = 0
+        for s in range(81):
+            if mask >> s & 1:
+                image |= 1 << self.squares[s]
+        return image
+
+    def __repr__(self):
+        return f"Symmetry({self.name})"
+
+
+ALL_SYMMETRIES = [Symmetry(name, matrix) for name, matrix in MATRICES.items()]
+for _symmetry in ALL_SYMMETRIES:
+    _symmetry.inverse = next(other for other in ALL_SYMMETRIES if other.squares[_symmetry.squares[10]] == 10 and
+                             all(other.squares[_symmetry.squares[s]] == s for s in range(81)))
+
+# player count -> the symmetries of its game (besides the identity), and the ones of them that keep every player
+GAME_SYMMETRIES = {n: [sym for sym in ALL_SYMMETRIES if sym.maps_game(n)] for n in range(2, 5)}
+KEPT_SYMMETRIES = {n: [sym for sym in GAME_SYMMETRIES[n] if sym.keeps_players(n)] for n in range(2, 5)}
+
+
+def to_canonical(symmetry, move):
+    #move of a position -> the same move in its canonical orientation (symmetry as returned by Calcstate.get_canonical)
+    return move if symmetry is None else symmetry.moves[move]
+
+
+def from_canonical(symmetry, move):
+    #move in the canonical orientation -> the same move in the position symmetry was returned for
+    return move if symmetry is None else symmetry.inverse.moves[move]
@@ -1,8 +1,21 @@
 from player import Player
 from calcstate import Calcstate
+from base_mcts_bot import find_subtree
+from reply_table import OppReplyTable
+from symmetry import to_canonical, from_canonical
 import math, random
 
+# The bot keeps an OppReplyTable for the whole game: every opponent move on a search path (in the tree or in the
+# first reply_plies plies of a rollout) is recorded under the hash of the position it was played from, with the
+# rollout result R from the bot's point of view. The table keeps the lowest means, i.e. the opponent's strongest replies.
+# Expansions of a position found in the table try its stored replies first and rollouts play them with
+# probability reply_prob, so later searches start out along the replies earlier ones found.
+# With use_symmetry positions are recorded under Calcstate.get_canonical and their replies in the canonical orientation,
+# so a reply found in a position is also tried in its mirror image.
+
 class TableMCTSnode:
+    __slots__ = ("state", "parent", "move_from_parent", "N", "W", "children", "untried")
+
     def __init__(self, calcstate, parent, move_from_parent):
         self.state = calcstate
         self.parent = parent
@@ -23,10 +36,30 @@ class TableMCTSnode:
     
 
 class TableMCTSbot(Player):
-    def __init__(self, expansions):
+    def __init__(self, expansions, reuse_tree = True, reply_prob = 0.5, reply_plies = 8, table_states = 100000, replies_per_state = 6,
+                 use_symmetry = False, rollout_cap = 256, verbose = True):
+        '''
+        Args:
+            expansions: number of search iterations per move
+            reuse_tree: carry the searched subtree over to the next choose_move call when the new position is in it
+            reply_prob: probability that a rollout plays the stored reply of an opponent's position found in the table
+            reply_plies: opponent moves in the first reply_plies plies of a rollout are recorded in the table
+            table_states, replies_per_state: size of the OppReplyTable
+            use_symmetry: key the table by canonical position (only symmetries that keep the players, R is ours)
+            rollout_cap: most plies a rollout plays before Calcstate.get_static_eval scores it instead (None plays to the end)
+            verbose: print search progress and the reply table's statistics
+        '''
         self.expansion_count = expansions
+        self.reuse_tree = reuse_tree
+        self.replies = OppReplyTable(table_states, replies_per_state)
+        self.reply_prob = reply_prob
+        self.reply_plies = reply_plies
+        self.use_symmetry = use_symmetry
+        self.root = None
+        self.last_move = None
         self.c_uct = 1.414
-        self.rollout_cap = 256
+        self.rollout_cap = rollout_cap
+        self.verbose = verbose
         self.player_id = None
 
     def choose_move(self, gamestate):
@@ -35,41 +68,56 @@ class TableMCTSbot(Player):
         self.player_id = calcstate.player_up
         self.max_depth = 0
 
-        root = TableMCTSnode(calcstate, None, None)
+        root = self._reuse_root(calcstate)
+        if root is None:
+            root = TableMCTSnode(calcstate, None, None)
 
         for iteration in range(self.expansion_count):
-
-            print(f"({iteration}/{self.expansion_count}), {self.max_depth}", end="\r")
+            if self.verbose:
+                print(f"({iteration}/{self.expansion_count}), {self.max_depth}", end="\r")
             node = root
             depth = 0
             while (not node.state.over) and node.fully_expanded:
-                # print(node.state)
-                # print(node.untried[-5:])
                 depth += 1
                 node = self._select_uct(node)
             if depth > self.max_depth:
                 self.max_depth = depth
             
             if (not node.state.over) and node.untried:
-                move = node.untried.pop(random.randrange(len(node.untried)))
+                move = self._pick_untried(node)
                 child_state = node.state.get_clone()
                 child_state.play_move(move)
-                
-                
                 child = TableMCTSnode(child_state, node, move)
                 node.children[move] = child
                 node = child
-                # print(node.state)
-                # print(node.untried[-5:])
 
-            value = 1 if self._rollout_to_terminal(node.state) else 0
+            value, replies = self._rollout_to_terminal(node.state)
 
-            self._backprop(node, value)
+            self._backprop(node, value, replies)
+            for h, move in replies:
+                self.replies.update(h, move, value)
             
         best_move = max(root.children.items(), key=lambda kv: kv[1].N)[0]
+        if self.verbose:
+            stats = self.replies.get_stats()
+            print(f"reply table: {stats['states']} states, {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions")
 
-
+        self.root, self.last_move = root, best_move
         return best_move
+
+    def _reuse_root(self, calcstate):
+        #detaches the node of calcstate's position below our last move as the new root (see BaseMCTSbot._reuse_root)
+        root, self.root = self.root, None
+        if not self.reuse_tree or root is None:
+            return None
+        child = root.children.get(self.last_move)
+        if child is None:
+            return None
+        state = child.state.get_clone()
+        found = find_subtree(child, state, calcstate.get_hash(), calcstate.player_count - 1)
+        if found is not None:
+            found.parent = None
+        return found
         
 
 
@@ -88,22 +136,76 @@ class TableMCTSbot(Player):
         return best_child
 
 
+    def _reply_key(self, state):
+        #(table hash of state, symmetry to the orientation its replies are stored in or None)
+        if self.use_symmetry:
+            return state.get_canonical()
+        return state.get_hash(), None
+
+    def _stored_reply(self, state, h, symmetry = None):
+        #the stored reply of the opponent to move with the lowest mean for us, if the position is in the table
+        move = self.replies.best(h)
+        if move is None:
+            return None
+        move = from_canonical(symmetry, move)
+        # a hash collision could bring up a move from another position
+        return move if state.is_legal_move(move) else None
+
+    def _pick_untried(self, node):
+        #expands the opponent's stored replies first (strongest first), otherwise a random untried move
+        untried = node.untried
+        if node.state.player_up != self.player_id:
+            h, symmetry = self._reply_key(node.state)
+            replies = self.replies.get(h)
+            if replies:
+                for move, _, _ in replies:
+                    move = from_canonical(symmetry, move)
+                    if move in untried:
+                        untried.remove(move)
+                        return move
+        return untried.pop(random.randrange(len(untried)))
+
     def _rollout_to_terminal(self, state):
-        s: Calcstate = state.get_clone()
+        '''
+        Plays a rollout of at most rollout_cap plies, opponents play their stored replies with probability reply_prob
+
+        Returns:
+            (1 if this bot's player won else 0 or the static win probability if the cap was reached first,
+            list of (hash, move) of the opponent moves to record, see _reply_key)
+        '''
+        s: Calcstate = state.get_clone(private = True)
+        replies = []
+        plies = 0
         while not s.over:
-            moves = s.get_legal_moves()
-            if not moves:
+            if self.rollout_cap is not None and plies >= self.rollout_cap:
+                return s.get_static_eval(self.player_id), replies
+            m = None
+            if s.player_up != self.player_id and plies < self.reply_plies:
+                h, symmetry = self._reply_key(s)
+                if random.random() < self.reply_prob:
+                    m = self._stored_reply(s, h, symmetry)
+                if m is None:
+                    m = s.get_random_move()
+                if m is not None:
+                    replies.append((h, to_canonical(symmetry, m)))
+            else:
+                m = s.get_random_move()
+            if m is None:
                 break
-            m = random.choice(moves)
             s.play_move(m)
             s.try_early_eval()
-        return s.winner == self.player_id
+            plies += 1
+        return (1 if s.winner == self.player_id else 0), replies
     
-    def _backprop(self, node, value_from_me):
+    def _backprop(self, node, value_from_me, replies):
+        #also adds the opponent moves of the tree part of the path to replies
         n = node
         while n is not None:
             n.N += 1
             n.W += value_from_me
+            if n.parent is not None and n.parent.state.player_up != self.player_id:
+                h, symmetry = self._reply_key(n.parent.state)
+                replies.append((h, to_canonical(symmetry, n.move_from_parent)))
             n = n.parent
         
             
\ No newline at end of file
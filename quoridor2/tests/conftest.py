@@ -0,0 +1,4 @@
+import os, sys
+
+# the sources import each other by module name, so the tests run with quoridor2 on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
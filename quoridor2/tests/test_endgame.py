@@ -0,0 +1,81 @@
+import random
+from calcstate import Calcstate
+from endgame import EndgameSolver, WIN, DRAW
+
+
+def negamax(state, depth):
+    #1 if the player to move wins within depth plies, -1 if they lose within depth plies, else 0
+    if state.over:
+        return -1
+    if depth == 0:
+        return 0
+    moves = state.get_legal_pawn_moves()
+    if not moves:
+        record = state.skip_turn()
+        value = -negamax(state, depth - 1)
+        state.undo_move(record)
+        return value
+    best = -1
+    for move in moves:
+        record = state.make_move(move)
+        best = max(best, -negamax(state, depth - 1))
+        state.undo_move(record)
+        if best == 1:
+            break
+    return best
+
+
+def endgame_positions(count, seed):
+    #wall exhausted two player positions: random walls, then pawn moves mixing random and solver play
+    random.seed(seed)
+    solver = EndgameSolver()
+    while count > 0:
+        state = Calcstate()
+        state.set_up_as_start(2, total_walls=random.choice([0, 6, 12, 20]))
+        while not state.over and state.wall_count:
+            state.play_move(state.get_random_move())
+        while count > 0 and solver.covers(state):
+            yield solver, state
+            count -= 1
+            moves = state.get_legal_pawn_moves()
+            if not moves:
+                state.skip_turn()
+            elif random.random() < 0.7:
+                state.play_move(random.choice(moves))
+            else:
+                state.play_move(solver.get_move(state)[0])
+
+
+def test_results_match_negamax():
+    checked = 0
+    for solver, state in endgame_positions(400, seed=3):
+        value, plies = solver.get_result(state)
+        if value == DRAW or plies > 7:
+            continue
+        # decided in exactly plies: negamax finds the result at that depth and not one ply earlier
+        assert negamax(state, plies) == value
+        assert negamax(state, plies - 1) == 0
+        checked += 1
+    assert checked > 50
+
+
+def test_best_move_keeps_the_result():
+    for solver, state in endgame_positions(200, seed=5):
+        value, plies = solver.get_result(state)
+        table = solver.get_table(state)
+        positions = solver.get_positions(state)
+        own, other = positions if state.player_up == 0 else positions[::-1]
+        assert sorted(m for m in table.moves[own, other] if m >= 0) == sorted(state.get_legal_pawn_moves())
+        move, _, _ = solver.get_move(state)
+        if move is None:
+            continue
+        record = state.make_move(move)
+        # the best move reaches the result: a won child loses for the opponent one ply sooner
+        if state.over:
+            assert (value, plies) == (WIN, 1)
+        else:
+            child_value, child_plies = solver.get_result(state)
+            assert -child_value == value
+            if value != DRAW:
+                assert child_plies == plies - 1
+        state.undo_move(record)
@@ -0,0 +1,40 @@
+import random
+import pytest
+from calcstate import Calcstate
+from distance_field import build_field
+
+
+def check_fields_and_paths(state):
+    grid = state.grid
+    for i in range(state.player_count):
+        fresh = build_field(grid, state.goal_masks[i])
+        assert state.dists[i].dist == fresh.dist
+        assert state.dists[i].layers == fresh.layers
+
+        # several shortest paths can tie, so the kept path is checked to be one of them: it starts on the pawn,
+        # takes open steps only, ends on a goal square and is as long as the full A* path
+        x, y = state.player_positions[i]
+        path = list(state.paths[i])
+        full = grid.astar_full_path((x, y), state.goals[i], as_indices = True)
+        assert path[0] == 9 * y + x
+        assert len(path) == len(full)
+        for a, b in zip(path, path[1:]):
+            assert b in grid.get_neighbor_indices(a)
+        assert state.goal_masks[i] >> path[-1] & 1
+
+
+@pytest.mark.parametrize("backend", ["bitboard", "array", "numba"])
+@pytest.mark.parametrize("player_count", [2, 4])
+def test_incremental_fields_match_a_full_rebuild(backend, player_count):
+    random.seed(player_count)
+    for game in range(3):
+        state = Calcstate()
+        state.set_up_as_start(player_count, backend = backend)
+        check_fields_and_paths(state)
+        while not state.over:
+            moves = state.get_legal_moves()
+            if not moves:
+                state.skip_turn()
+                continue
+            state.play_move(random.choice(moves))
+            check_fields_and_paths(state)
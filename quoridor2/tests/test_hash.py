@@ -0,0 +1,45 @@
+import random
+import pytest
+from calcstate import Calcstate
+
+
+def fresh_hashes(state):
+    #the hash and symmetry hashes computed from scratch, on a copy so the state's own stay incremental
+    copy = Calcstate()
+    copy.load_serialized(state.serialize())
+    return copy.get_hash(), None if state._symhash is None else copy._rehash_symmetries()
+
+
+@pytest.mark.parametrize("player_count", [2, 3, 4])
+def test_incremental_hash_matches_a_rehash(player_count, monkeypatch):
+    # debug_hash makes every play_move and skip_turn check itself against _rehash as well
+    monkeypatch.setattr(Calcstate, "debug_hash", True)
+    random.seed(player_count)
+    for game in range(3):
+        state = Calcstate()
+        state.set_up_as_start(player_count)
+        state.get_canonical()
+        while not state.over:
+            moves = state.get_legal_moves()
+            if not moves:
+                state.skip_turn()
+                continue
+            before = (state.get_hash(), state._symhash)
+            record = state.make_move(random.choice(moves))
+            assert (state.get_hash(), state._symhash) == fresh_hashes(state)
+            state.undo_move(record)
+            assert (state.get_hash(), state._symhash) == before == fresh_hashes(state)
+            state.play_move(random.choice(moves))
+            assert (state.get_hash(), state._symhash) == fresh_hashes(state)
+
+
+def test_transposed_move_orders_share_a_hash():
+    a = Calcstate()
+    a.set_up_as_start(2)
+    b = a.get_clone()
+    # the same two walls, placed in either order, then a step by each pawn
+    for move in (0, 70, 128 + 13, 128 + 67):
+        a.play_move(move)
+    for move in (70, 0, 128 + 13, 128 + 67):
+        b.play_move(move)
+    assert a.get_hash() == b.get_hash()
@@ -0,0 +1,85 @@
+import random
+import pytest
+from calcstate import Calcstate
+
+
+def snapshot(state):
+    return state.serialize(), sorted(state.get_legal_moves())
+
+
+@pytest.mark.parametrize("player_count", [2, 3, 4])
+def test_undo_restores_every_ply(player_count):
+    rng = random.Random(player_count)
+    for game in range(4):
+        state = Calcstate()
+        state.set_up_as_start(player_count, total_walls = 12)
+        while not state.over:
+            before = snapshot(state)
+            moves = state.get_legal_moves()
+            if not moves:
+                state.skip_turn()
+                continue
+            for move in rng.sample(moves, min(4, len(moves))):
+                record = state.make_move(move)
+                state.undo_move(record)
+                assert snapshot(state) == before
+            state.play_move(rng.choice(moves))
+
+
+def test_undo_a_whole_line():
+    random.seed(7)
+    state = Calcstate()
+    state.set_up_as_start(2)
+    line = []
+    while not state.over:
+        line.append((snapshot(state), state.make_move(state.get_random_move())))
+    for before, record in reversed(line):
+        state.undo_move(record)
+        assert snapshot(state) == before
+
+
+def test_undo_leaves_clones_alone():
+    rng = random.Random(3)
+    state = Calcstate()
+    state.set_up_as_start(2)
+    for ply in range(30):
+        if state.over:
+            break
+        clone = state.get_clone()
+        before = snapshot(state)
+        record = state.make_move(rng.choice(state.get_legal_moves()))
+        #the clone shares containers with state until one of them writes
+        assert snapshot(clone) == before
+        clone.play_move(rng.choice(clone.get_legal_moves()))
+        state.undo_move(record)
+        assert snapshot(state) == before
+        # a clone taken between make and undo must not see the undo either
+        record = state.make_move(rng.choice(state.get_legal_moves()))
+        after = snapshot(state)
+        inner = state.get_clone()
+        state.undo_move(record)
+        assert snapshot(inner) == after
+        assert snapshot(state) == before
+        state.play_move(rng.choice(state.get_legal_moves()))
+
+
+def test_private_clones_leave_the_source_unshared():
+    # rollouts clone the search state with private, its next make_move must not have to copy anything
+    rng = random.Random(5)
+    state = Calcstate()
+    state.set_up_as_start(2)
+    state.play_move(rng.choice(state.get_legal_moves()))
+    for ply in range(30):
+        if state.over:
+            break
+        before = snapshot(state)
+        clone = state.get_clone(private = True)
+        assert not state._shared and not clone._shared
+        while not clone.over:
+            clone.play_move(clone.get_random_move())
+        assert snapshot(state) == before
+        record = state.make_move(rng.choice(state.get_legal_moves()))
+        assert not state._shared
+        state.undo_move(record)
+        assert snapshot(state) == before
+        state.play_move(rng.choice(state.get_legal_moves()))
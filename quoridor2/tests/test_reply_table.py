@@ -0,0 +1,16 @@
+import pytest
+from reply_table import OppReplyTable
+
+
+@pytest.mark.parametrize("options", [{"keep": "low"}, {"keep": "best"}, {"max_bytes": 0}, {"max_bytes": -1}])
+def test_bad_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        OppReplyTable(**options)
+
+
+def test_keep_orders_the_replies():
+    for keep, first in (("lowest", 1), ("highest", 2)):
+        table = OppReplyTable(keep = keep)
+        table.update(7, 1, 0.2)
+        table.update(7, 2, 0.8)
+        assert table.best(7) == first
@@ -0,0 +1,24 @@
+import random
+import numpy as np
+import pytest
+from calcstate import Calcstate
+
+
+def same(a, b):
+    #serialize tuples, the array backends' grid snapshots are ndarrays
+    return len(a) == len(b) and all(np.array_equal(x, y) if isinstance(x, np.ndarray) else x == y for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize("backend", ["bitboard", "array", "numba"])
+def test_round_trip_keeps_the_backend(backend):
+    random.seed(5)
+    state = Calcstate()
+    state.set_up_as_start(2, backend = backend)
+    for ply in range(20):
+        state.play_move(state.get_random_move())
+        loaded = Calcstate()
+        loaded.load_serialized(state.serialize())
+        assert type(loaded.grid) is type(state.grid)
+        assert same(loaded.serialize(), state.serialize())
+        assert sorted(loaded.get_legal_moves()) == sorted(state.get_legal_moves())
+        assert loaded.get_hash() == state.get_hash()
@@ -0,0 +1,53 @@
+import random
+import pytest
+from calcstate import Calcstate
+from symmetry import GAME_SYMMETRIES, to_canonical, from_canonical
+from moves import MOVE_COUNT
+
+
+def mirror_games(player_count, games, plies):
+    #yields (position, [its image under each game symmetry]) along random games, the images playing the image moves
+    for game in range(games):
+        state = Calcstate()
+        state.set_up_as_start(player_count)
+        mirrors = []
+        for sym in GAME_SYMMETRIES[player_count]:
+            mirror = Calcstate()
+            mirror.set_up_as_start(player_count)
+            # symmetries that swap players start from the seat player 0's image sits in
+            mirror.player_up = sym.players[0]
+            mirrors.append(mirror)
+        for ply in range(plies):
+            if state.over:
+                break
+            move = state.get_random_move()
+            for sym, mirror in zip(GAME_SYMMETRIES[player_count], mirrors):
+                mirror.play_move(sym.moves[move])
+            state.play_move(move)
+            yield state, mirrors
+
+
+@pytest.mark.parametrize("player_count", [2, 4])
+def test_mirrored_positions_share_a_canonical_hash(player_count):
+    random.seed(player_count)
+    for state, mirrors in mirror_games(player_count, games=10, plies=60):
+        for sym, mirror in zip(GAME_SYMMETRIES[player_count], mirrors):
+            if sym.keeps_players(player_count):
+                assert mirror.get_canonical()[0] == state.get_canonical()[0]
+            assert mirror.get_canonical(False)[0] == state.get_canonical(False)[0]
+            assert sorted(mirror.get_legal_moves()) == sorted(sym.moves[move] for move in state.get_legal_moves())
+
+
+def test_canonical_moves_round_trip():
+    random.seed(1)
+    for state, mirrors in mirror_games(2, games=3, plies=30):
+        _, symmetry = state.get_canonical(False)
+        for move in range(MOVE_COUNT):
+            assert from_canonical(symmetry, to_canonical(symmetry, move)) == move
+
+
+def test_no_symmetries_for_three_players():
+    state = Calcstate()
+    state.set_up_as_start(3)
+    assert GAME_SYMMETRIES[3] == []
+    assert state.get_canonical() == (state.get_hash(), None)
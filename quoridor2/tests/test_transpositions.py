@@ -0,0 +1,42 @@
+import random
+from calcstate import Calcstate
+from base_mcts_bot import BaseMCTSbot
+from endgame import EndgameSolver
+
+
+def test_root_visits_match_iterations():
+    # every iteration adds exactly one visit per node on its path, so a cycle back to the root must not count it twice
+    random.seed(2)
+    state = Calcstate()
+    state.set_up_as_start(2, total_walls = 0)
+    bot = BaseMCTSbot(300, use_transpositions = True, verbose = False, endgame_oracle = None)
+    bot.choose_move(state)
+    assert bot.root.N == 300
+    children = [bot.table.peek(h) for h in bot.root.children.values()]
+    assert all(child.N <= bot.root.N for child in children if child is not None)
+
+
+def test_mirrored_root_moves_share_one_child():
+    # the start position is its own mirror image, so the mirrored moves of the root lead to one canonical node that
+    # must only be counted once
+    random.seed(3)
+    state = Calcstate()
+    state.set_up_as_start(2)
+    bot = BaseMCTSbot(300, use_transpositions = True, use_symmetry = True, verbose = False, endgame_oracle = None)
+    bot.choose_move(state)
+    assert len(set(bot.root.children.values())) == len(bot.root.children)
+    assert sum(n for n, w in bot.get_root_statistics().values()) == 300
+
+
+def test_no_root_statistics_without_a_search():
+    state = Calcstate()
+    state.set_up_as_start(2, total_walls = 0)
+    bot = BaseMCTSbot(50, verbose = False)
+    assert bot.get_root_statistics() == {}
+    bot.endgame_oracle, bot.endgame = None, None
+    bot.choose_move(state)
+    assert bot.get_root_statistics()
+    # a position without walls left is answered by the endgame solver, the last search's children must not show up
+    bot.endgame = EndgameSolver()
+    bot.choose_move(state)
+    assert bot.get_root_statistics() == {}
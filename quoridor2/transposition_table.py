@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+class TranspositionTable:
+    '''
+    Bounded map from Calcstate hash to search node, so positions reached by different move orders share one node.
+    Once capacity is reached the least recently used entry is evicted (get counts as a use, peek does not).
+    '''
+    def __init__(self, capacity = 1000000):
+        self.capacity = capacity
+        self.store = OrderedDict()
+        self.evictions = 0
+
+    def get(self, h):
+        '''returns the node for calcstate hash h (or None) and marks it as recently used'''
+        node = self.store.get(h)
+        if node is not None:
+            self.store.move_to_end(h)
+        return node
+
+    def peek(self, h):
+        '''returns the node for calcstate hash h (or None) without touching its age'''
+        return self.store.get(h)
+
+    def put(self, h, node):
+        self.store[h] = node
+        self.store.move_to_end(h)
+        if len(self.store) > self.capacity:
+            self.store.popitem(last=False)
+            self.evictions += 1
+
+    def retain(self, keep):
+        '''drops every entry whose hash is not in keep, the rest keep their age order'''
+        dropped = len(self.store)
+        self.store = OrderedDict((h, node) for h, node in self.store.items() if h in keep)
+        return dropped - len(self.store)
+
+    def clear(self):
+        self.store.clear()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, h):
+        return h in self.store
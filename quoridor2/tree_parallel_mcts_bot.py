@@ -0,0 +1,208 @@
+from base_mcts_bot import BaseMCTSbot
+from calcstate import Calcstate
+from gamestate import Gamestate
+import math, random, sys, threading, time
+
+# Tree parallel MCTS: several threads descend one shared tree. Every thread walks its own Calcstate with
+# make_move / undo_move and only holds the tree lock while it reads or writes node statistics, so rollouts
+# (the bulk of the work) run unlocked and overlap on a free threaded interpreter.
+# A thread passing through a node adds a virtual loss to it (counted as a visit that won nothing) until its result
+# is backed up, which steers the other threads onto different branches.
+# Anything else the workers share is locked as well: every worker counts its rollouts in its own rollout_stats
+# dict, merged into the bot's when it finishes, and the EndgameSolver cache has a lock of its own.
+
+
+class NodeArena:
+    '''
+    Node statistics in flat lists indexed by node id (0 is the root), so workers update numbers in place
+    instead of objects.
+    '''
+    def __init__(self):
+        self.N = []
+        self.W = []
+        self.VL = []
+        self.parent = []
+        self.move = []
+        self.over = []
+        self.children = []
+        self.untried = []
+
+    def add(self, calcstate, parent, move, untried):
+        self.N.append(0)
+        self.W.append(0.0)
+        self.VL.append(0)
+        self.parent.append(parent)
+        self.move.append(move)
+        self.over.append(calcstate.over)
+        self.children.append({})
+        self.untried.append(untried)
+        return len(self.N) - 1
+
+    def __len__(self):
+        return len(self.N)
+
+
+class TreeParallelMCTSbot(BaseMCTSbot):
+    def __init__(self, expansions, workers = 4, virtual_loss = 1, verbose = True, rollouts_per_leaf = 1, rollout_policy = "random",
+                 rollout_weights = None, rollout_cap = 256, opening_book = None, endgame_oracle = "cached"):
+        '''
+        Args:
+            expansions: search iterations per move, shared by all workers
+            workers: number of threads descending the tree
+            virtual_loss: visits (with no wins) added to a node while a worker's rollout below it is running
+            verbose: print search progress
+            rollouts_per_leaf: playouts per expanded leaf (see BaseMCTSbot)
+            rollout_policy, rollout_weights, rollout_cap: rollout move choice and length (see BaseMCTSbot)
+            opening_book: OpeningBook consulted before searching (see BaseMCTSbot)
+            endgame_oracle: use of the endgame solver for positions without walls left (see BaseMCTSbot)
+        '''
+        super().__init__(expansions, reuse_tree = False, verbose = verbose, rollouts_per_leaf = rollouts_per_leaf,
+                         rollout_policy = rollout_policy, rollout_weights = rollout_weights, rollout_cap = rollout_cap,
+                         opening_book = opening_book, endgame_oracle = endgame_oracle)
+        self.workers = workers
+        self.virtual_loss = virtual_loss
+        self.arena = None
+        self.lock = threading.Lock()
+
+    def choose_move(self, gamestate):
+        calcstate = Calcstate()
+        calcstate.import_gamestate(gamestate)
+        self.player_id = calcstate.player_up
+        self.max_depth = 0
+        self.iterations = 0
+        #no tree until this search runs, so book and endgame moves leave no root statistics
+        self.arena = None
+
+        book_move = self._book_move(calcstate)
+        if book_move is not None:
+            return book_move
+        endgame_move = self._endgame_move(calcstate)
+        if endgame_move is not None:
+            return endgame_move
+
+        arena = self.arena = NodeArena()
+        arena.add(calcstate, None, None, calcstate.get_legal_moves())
+
+        threads = [threading.Thread(target = self._work, args = (calcstate.get_clone(private = True),)) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        best_move = max(arena.children[0].items(), key=lambda kv: arena.N[kv[1]])[0]
+        return best_move
+
+    def _work(self, state):
+        #one worker: runs iterations on its own state until the shared budget is used up
+        arena = self.arena
+        lock = self.lock
+        stats = dict.fromkeys(self.rollout_stats, 0)
+        while True:
+            with lock:
+                if self.iterations >= self.expansion_count:
+                    for key, count in stats.items():
+                        self.rollout_stats[key] += count
+                    return
+                iteration = self.iterations
+                self.iterations += 1
+                arena.VL[0] += self.virtual_loss
+                max_depth = self.max_depth
+            if self.verbose:
+                print(f"({iteration}/{self.expansion_count}), {max_depth}", end="\r")
+
+            records = []
+            node = 0
+            while True:
+                with lock:
+                    if arena.over[node] or arena.untried[node]:
+                        break
+                    child = self._select_uct(node)
+                if child is None:
+                    break
+                records.append(state.make_move(arena.move[child]))
+                node = child
+            with lock:
+                if len(records) > self.max_depth:
+                    self.max_depth = len(records)
+                move = None
+                untried = arena.untried[node]
+                if not arena.over[node] and untried:
+                    move = untried.pop(random.randrange(len(untried)))
+            if move is not None:
+                records.append(state.make_move(move))
+                legal_moves = state.get_legal_moves()
+                with lock:
+                    child = arena.add(state, node, move, legal_moves)
+                    arena.children[node][move] = child
+                    arena.VL[child] += self.virtual_loss
+                node = child
+
+            value = self._rollout_leaf(state, stats)
+            with lock:
+                self._backprop(node, value, self.rollouts_per_leaf)
+
+            for record in reversed(records):
+                state.undo_move(record)
+
+    def _select_uct(self, node):
+        '''
+        BaseMCTSbot._select_uct on the arena, counting virtual losses as visits without wins.
+        Adds a virtual loss to the selected child. Must be called with the tree lock held.
+
+        Returns:
+            the id of the selected child, or None if node has no children
+        '''
+        arena = self.arena
+        N, W, VL = arena.N, arena.W, arena.VL
+        parent_N = N[node] + VL[node]
+        c = self.c_uct
+        explore = c * math.sqrt(max(1.0, math.log(max(1, parent_N))))
+        best_child, best_score = None, -1e100
+        for child in arena.children[node].values():
+            n = N[child] + VL[child]
+            q = 0.0 if n == 0 else W[child] / n
+            score = q + explore / (1 + n)
+            if score > best_score:
+                best_score, best_child = score, child
+        if best_child is not None:
+            VL[best_child] += self.virtual_loss
+        return best_child
+
+    def _backprop(self, node, value_from_me, count = 1):
+        #commits a rollout result up to the root and takes back the virtual losses of its descent (tree lock held)
+        arena = self.arena
+        virtual_loss = self.virtual_loss
+        n = node
+        while n is not None:
+            arena.N[n] += count
+            arena.W[n] += value_from_me
+            arena.VL[n] -= virtual_loss
+            n = arena.parent[n]
+
+    def get_root_statistics(self):
+        arena = self.arena
+        if arena is None:
+            return {}
+        return {move: (arena.N[child], arena.W[child]) for move, child in arena.children[0].items()}
+
+
+if __name__ == "__main__":
+    # speedup of the shared tree search over the single threaded bot at the same number of iterations
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"GIL {'enabled, threads will not overlap' if gil else 'disabled'}")
+    expansions = 1000
+    g = Gamestate()
+    g.set_up_as_start(2)
+
+    random.seed("bagel")
+    start = time.time()
+    BaseMCTSbot(expansions, make_unmake = True, verbose = False).choose_move(g)
+    base_time = time.time() - start
+    print(f"BaseMCTSbot: {expansions / base_time:.0f} iterations/s")
+
+    for workers in (1, 2, 4, 8):
+        random.seed("bagel")
+        start = time.time()
+        TreeParallelMCTSbot(expansions, workers = workers, verbose = False).choose_move(g)
+        elapsed = time.time() - start
+        print(f"{workers} workers: {expansions / elapsed:.0f} iterations/s, speedup {base_time / elapsed:.2f}")